@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Offline benchmark and correctness suite of the APOD page parsers.
+
+Runs every parser path over the page corpus (tools/apod_corpus, one page
+per layout era, image/video/other) and compares the fields with the
+golden records of golden.json. The text parsers get the saved pages;
+parse_apod and _get_apod_chars fetch them from a local HTTP stand-in
+that the plugin's pooled client is routed to, so no network is needed.
+
+For each path it reports pages/s, p50/p99 latency, peak Python memory
+during one pass (tracemalloc: libxml2's own buffers are not counted) and
+the fields matching the golden data. --processes N adds the throughput
+of the batch API (parse_pages over a pool of N processes).
+Exit status 1 when any parser path disagrees with the golden data: the
+fallbacks must stay as right as parse_apod_page, which the plugin uses.
+
+Runs on a PC: the plugin package is loaded without its __init__, which
+needs enigma.
+
+    python3 tools/bench_parser.py [--rounds N] [--processes N] [--verbose]
+                                  [CORPUS]
+    python3 tools/bench_parser.py --write-golden   # then review the diff
+"""
+
+import argparse
+import functools
+import importlib
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import types
+from datetime import datetime
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+from requests.adapters import HTTPAdapter
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+PLUGIN_DIR = os.path.join(
+    TOOLS_DIR, os.pardir,
+    "usr", "lib", "enigma2", "python", "Plugins", "Extensions", "apod")
+CORPUS_DIR = os.path.join(TOOLS_DIR, "apod_corpus")
+GOLDEN_NAME = "golden.json"
+TEXT_PATHS = ("parse_apod_lxml", "parse_apod_soup", "parse_apod_page")
+HTTP_PATHS = ("_get_apod_chars", "parse_apod")
+
+
+def load_utility(scratch=None):
+    """Import res.lib.apod_utility with a bare plugin package."""
+    if scratch is None:
+        scratch = tempfile.mkdtemp(prefix="apod_bench_") + os.sep
+    package = types.ModuleType("apod")
+    package.__path__ = [os.path.normpath(PLUGIN_DIR)]
+    # what the modules imported by apod_utility read from the package
+    package.CACHE_DIR = package.TMP_CACHE_DIR = package.SYSTEM_DIR = scratch
+    package.HEADERS = {}
+    package.MIN_FREE_SPACE = 0
+    package.free_space = lambda path: 1 << 40
+    package._ = lambda text: text
+    sys.modules["apod"] = package
+    return importlib.import_module("apod.res.lib.apod_utility")
+
+
+class _QuietHandler(SimpleHTTPRequestHandler):
+
+    def log_message(self, *args):
+        pass
+
+
+class StandIn(HTTPAdapter):
+    """Transport adapter sending apod.nasa.gov requests to a local server."""
+
+    def __init__(self, base, local):
+        HTTPAdapter.__init__(self)
+        self.base = base
+        self.local = local
+
+    def send(self, request, **kwargs):
+        request.url = self.local + request.url[len(self.base):]
+        return HTTPAdapter.send(self, request, **kwargs)
+
+
+def start_stand_in(utility, corpus):
+    """Serve the corpus locally and route the plugin client to it."""
+    server = ThreadingHTTPServer(
+        ("127.0.0.1", 0), functools.partial(_QuietHandler, directory=corpus))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    local = "http://127.0.0.1:{}/".format(server.server_address[1])
+    http = importlib.import_module("apod.apod_http")
+    http.get_client().session.mount(
+        utility.BASE, StandIn(utility.BASE, local))
+    return server
+
+
+def page_date(name):
+    """Date of an apYYMMDD page name."""
+    return datetime.strptime(name[2:8], "%y%m%d")
+
+
+def read_corpus(corpus):
+    """[(name, text or None, dt)] for the pages and the golden records."""
+    with open(os.path.join(corpus, GOLDEN_NAME), encoding="utf-8") as f:
+        golden = json.load(f)
+    names = set(golden)
+    names.update(
+        n[:-5] for n in os.listdir(corpus)
+        if n.startswith("ap") and n.endswith(".html"))
+    pages = []
+    for name in sorted(names, key=page_date):
+        path = os.path.join(corpus, name + ".html")
+        text = None
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                # as fetch_text() does: the parsers fix the cp1252 characters
+                text = f.read().decode("latin1", errors="replace")
+        pages.append((name, text, page_date(name)))
+    return pages, golden
+
+
+def path_call(utility, path):
+    """(function(text, dt), needs_text) running one parser path."""
+    function = getattr(utility, path)
+    if path == "_get_apod_chars":
+        return (lambda text, dt: function(dt, False)), False
+    if path == "parse_apod":
+        return (lambda text, dt: function(dt, thumbs=False)), False
+    return function, True
+
+
+def run_once(call, text, dt):
+    try:
+        return call(text, dt)
+    except Exception as e:
+        return e
+
+
+def score(result, expected):
+    """(matching fields, compared fields, mismatch descriptions)."""
+    if expected is None:
+        ok = result is None
+        return int(ok), 1, [] if ok else ["expected no entry"]
+    if not isinstance(result, dict):
+        return 0, len(expected), ["{!r}".format(result)]
+    fields = sorted(set(expected) | set(result))
+    bad = [
+        "{}: {!r} != {!r}".format(key, result.get(key), expected.get(key))
+        for key in fields if result.get(key) != expected.get(key)]
+    return len(fields) - len(bad), len(fields), bad
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def bench(path, call, pages, golden, rounds):
+    report = {"path": path, "ok": 0, "fields": 0, "errors": []}
+    # correctness and warm up (the stand-in fills the page cache)
+    for name, text, dt in pages:
+        if name not in golden:
+            continue
+        ok, total, bad = score(run_once(call, text, dt), golden[name])
+        report["ok"] += ok
+        report["fields"] += total
+        report["errors"].extend("{} {}".format(name, b) for b in bad)
+    latencies = []
+    for _ in range(rounds):
+        for _name, text, dt in pages:
+            start = time.perf_counter()
+            run_once(call, text, dt)
+            latencies.append(time.perf_counter() - start)
+    tracemalloc.start()
+    for _name, text, dt in pages:
+        run_once(call, text, dt)
+    report["peak"] = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    report["rate"] = len(latencies) / sum(latencies)
+    report["p50"] = percentile(latencies, 0.50)
+    report["p99"] = percentile(latencies, 0.99)
+    return report
+
+
+def bench_batch(utility, pages, rounds, processes):
+    """Pages/s of parse_pages over a pool of `processes` (0: in process)."""
+    batch = [(text.encode("latin1"), dt)
+             for _name, text, dt in pages if text is not None] * rounds
+    # the workers start fresh: they need the bare package too
+    pool = (utility.parse_pool(processes, load_utility,
+                               (sys.modules["apod"].SYSTEM_DIR,))
+            if processes else None)
+    try:
+        if pool is not None:
+            # start the workers before timing
+            utility.parse_pages(batch[:processes], pool=pool)
+        start = time.perf_counter()
+        utility.parse_pages(batch, pool=pool)
+        return len(batch) / (time.perf_counter() - start)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+
+def write_golden(utility, corpus, pages, golden):
+    """Record parse_apod_page output; dates without a page stay null."""
+    for name, text, dt in pages:
+        if text is not None:
+            golden[name] = utility.parse_apod_page(text, dt)
+    path = os.path.join(corpus, GOLDEN_NAME)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(golden, f, indent=1, sort_keys=True, ensure_ascii=False)
+        f.write("\n")
+    print("Wrote {} record(s), review them before committing".format(
+        len(golden)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("corpus", nargs="?", default=CORPUS_DIR)
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--processes", type=int, default=0,
+                        help="also time parse_pages on N processes")
+    parser.add_argument("--verbose", action="store_true",
+                        help="list every field that differs")
+    parser.add_argument("--write-golden", action="store_true")
+    args = parser.parse_args(argv)
+    utility = load_utility()
+    # the parsers log every fallback: that would be timed too
+    logging.disable(logging.CRITICAL)
+    pages, golden = read_corpus(args.corpus)
+    if args.write_golden:
+        write_golden(utility, args.corpus, pages, golden)
+        return 0
+    server = start_stand_in(utility, args.corpus)
+    print("{} page(s), {} round(s)".format(len(pages), args.rounds))
+    print("{:<16} {:>9} {:>8} {:>8} {:>9} {:>11}".format(
+        "path", "pages/s", "p50 ms", "p99 ms", "peak KiB", "fields ok"))
+    failed = False
+    try:
+        for path in TEXT_PATHS + HTTP_PATHS:
+            call, needs_text = path_call(utility, path)
+            subset = [p for p in pages if p[1] is not None or not needs_text]
+            report = bench(path, call, subset, golden, args.rounds)
+            print("{:<16} {:9.0f} {:8.3f} {:8.3f} {:9.0f} {:>11}".format(
+                path, report["rate"], report["p50"] * 1000,
+                report["p99"] * 1000, report["peak"] / 1024.0,
+                "{}/{}".format(report["ok"], report["fields"])))
+            if args.verbose:
+                for error in report["errors"]:
+                    print("    " + error)
+            if report["errors"]:
+                failed = True
+        if args.processes:
+            for processes in (0, args.processes):
+                rate = bench_batch(utility, pages, args.rounds, processes)
+                print("parse_pages, {} worker process(es): {:.0f} pages/s"
+                      .format(processes, rate))
+    finally:
+        server.shutdown()
+    if failed:
+        print("Fields differ from {}{}".format(
+            GOLDEN_NAME, "" if args.verbose else " (see --verbose)"))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,7 +2,10 @@
 # -*- coding: utf-8 -*-
 
 from Components.Language import language
+from Components.config import ConfigSelection, ConfigSubsection, config
 from Tools.Directories import resolveFilename, SCOPE_PLUGINS
+from os import W_OK, access, makedirs, statvfs
+from os.path import exists, isdir, ismount, join
 import gettext
 
 __author__ = "Lululla"
@@ -12,6 +15,9 @@ __license__ = "GPL-v2"
 __version__ = "2.1"
 DEBUG = True
 SYSTEM_DIR = '/etc/enigma2/apod'
+TMP_CACHE_DIR = "/tmp/apod_cache/"
+# never fill the cache filesystem below this
+MIN_FREE_SPACE = 32 * 1024 * 1024
 
 PluginLanguageDomain = 'apod'
 PluginLanguagePath = 'Extensions/apod/res/locale'
@@ -48,3 +54,50 @@ def _(txt):
 
 localeInit()
 language.addCallback(localeInit)
+
+
+def free_space(path):
+    """Bytes available to the plugin on the filesystem of `path`."""
+    try:
+        st = statvfs(path)
+        return st.f_bavail * st.f_frsize
+    except OSError:
+        return 0
+
+
+def resolve_cache_dir(root):
+    """
+    Cache folder under the configured `root`. A missing mount, a read only
+    device or a nearly full one falls back to the tmpfs folder.
+    """
+    if root and root != "/tmp":
+        folder = join(root, "apod_cache/")
+        mounted = ismount(root) or not root.startswith("/media/")
+        if (mounted and isdir(root) and access(root, W_OK) and
+                free_space(root) >= MIN_FREE_SPACE):
+            try:
+                if not exists(folder):
+                    makedirs(folder)
+                return folder
+            except OSError as e:
+                print("[%s] cannot create %s: %s" % (
+                    PluginLanguageDomain, folder, e))
+        print("[%s] cache location %s not usable, using %s" % (
+            PluginLanguageDomain, root, TMP_CACHE_DIR))
+    return TMP_CACHE_DIR
+
+
+# The cache location is read before any other module of the plugin is
+# imported, since they all build their paths from CACHE_DIR
+config.plugins.apod = ConfigSubsection()
+config.plugins.apod.cache_root = ConfigSelection(
+    default="/tmp",
+    choices=[
+        ("/tmp", _("RAM (/tmp)")),
+        ("/media/hdd", "/media/hdd"),
+        ("/media/usb", "/media/usb"),
+        ("/media/mmc", "/media/mmc"),
+        ("/etc/enigma2", _("Flash (/etc/enigma2)"))
+    ]
+)
+CACHE_DIR = resolve_cache_dir(config.plugins.apod.cache_root.value)
@@ -0,0 +1,230 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""
+APOD - Astronomy Picture of the Day Plugin
+Bulk archive backfill
+
+Builds the whole archive (1995-06-16 to today) in the local store from the
+ap%y%m%d.html pages, without the API and its rate limits:
+
+- pages are fetched oldest first by a few threads sharing the pooled
+  HttpClient, never more than FETCH_WORKERS at once and never closer than
+  MIN_INTERVAL seconds apart (apod.nasa.gov is a small server);
+- pages are parsed by parse_pages() in this process: lxml takes about
+  0.1 ms a page, nothing next to the throttled fetches, and forking a
+  parser pool from the multithreaded GUI process could deadlock;
+- records are normalized to the API field names and stored by batch, and a
+  checkpoint notes the dates with no page, so a stopped or failed run
+  resumes where it was and known gaps are not asked for again for
+  MISSING_RETRY_DAYS. Pages of the last days may just not be published
+  yet: their 404s are not recorded.
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from json import dumps, loads
+from os.path import exists, join
+
+from . import SYSTEM_DIR
+from .apod_cache import atomic_write
+from .apod_daily import eastern_now
+from .apod_http import get_client
+from .apod_store import date_str, get_store, to_date
+from .res.lib.apod_utility import BASE, parse_pages
+
+LOG = logging.getLogger(__name__)
+
+FIRST_DATE = date(1995, 6, 16)
+CHECKPOINT_FILE = join(SYSTEM_DIR, "apod_backfill.json")
+FETCH_WORKERS = 4
+MIN_INTERVAL = 0.25
+BATCH_DAYS = 50
+PAGE_TIMEOUT = 30
+FETCH_RETRIES = 2
+# a date without a page is asked for again after this many days
+MISSING_RETRY_DAYS = 30
+SERVICE_VERSION = "v1"
+
+
+def page_url(day):
+    return "{}ap{}.html".format(BASE, day.strftime("%y%m%d"))
+
+
+def normalize(props):
+    """API shaped record from the page parser output."""
+    entry = {"service_version": SERVICE_VERSION}
+    for key, value in props.items():
+        if isinstance(value, str):
+            value = value.strip()
+            if key == "copyright":
+                value = " ".join(value.split())
+        entry[key] = value
+    entry.setdefault("media_type", "other")
+    return entry
+
+
+class Throttle:
+    """Space calls from any thread at least `interval` seconds apart."""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._next = 0.0
+
+    def wait(self):
+        with self._lock:
+            now = time.time()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+
+class Backfill:
+    """
+    Fetch, parse and store every APOD page missing from the store.
+
+    run() is blocking and meant for a worker thread; on_progress, when
+    given, is called from that thread with (done, total) after each batch.
+    """
+
+    def __init__(self, store=None, workers=FETCH_WORKERS,
+                 interval=MIN_INTERVAL, checkpoint=CHECKPOINT_FILE):
+        self.store = store or get_store()
+        self.workers = max(1, workers)
+        self.throttle = Throttle(interval)
+        self.checkpoint = checkpoint
+        self.client = get_client()
+        # date -> time its page was found missing
+        self.missing = {}
+        self.unparsable = set()
+        self.stored = 0
+        self.failed = 0
+        self._cancelled = threading.Event()
+        self.load_checkpoint()
+
+    def cancel(self):
+        """Stop after the batch in progress."""
+        self._cancelled.set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def load_checkpoint(self):
+        if not exists(self.checkpoint):
+            return
+        try:
+            with open(self.checkpoint) as f:
+                state = loads(f.read())
+            missing = state.get("missing", {})
+            if isinstance(missing, list):
+                # checkpoints written before the expiry
+                missing = dict.fromkeys(missing, time.time())
+            expiry = time.time() - MISSING_RETRY_DAYS * 86400
+            self.missing = dict(
+                (day, found) for day, found in missing.items()
+                if found > expiry)
+            self.unparsable = set(state.get("unparsable", []))
+        except Exception as e:
+            LOG.warning("Ignoring backfill checkpoint: %s", e)
+
+    def save_checkpoint(self, last):
+        state = {
+            "last": last,
+            "missing": self.missing,
+            "unparsable": sorted(self.unparsable),
+            "updated": time.time()
+        }
+        try:
+            atomic_write(self.checkpoint, dumps(state))
+        except Exception as e:
+            LOG.error("Unable to save backfill checkpoint: %s", e)
+
+    def pending_dates(self, end=None):
+        """Dates not stored and not known to have no usable page."""
+        end = to_date(end or date.today())
+        skip = self.store.stored_dates(FIRST_DATE, end)
+        skip.update(self.missing)
+        skip.update(self.unparsable)
+        days = []
+        day = FIRST_DATE
+        one_day = timedelta(days=1)
+        while day <= end:
+            if date_str(day) not in skip:
+                days.append(day)
+            day += one_day
+        return days
+
+    def fetch(self, day):
+        """(day, status, bytes) of one page; status None on network error."""
+        url = page_url(day)
+        for attempt in range(FETCH_RETRIES + 1):
+            if self.cancelled:
+                break
+            self.throttle.wait()
+            try:
+                response = self.client.get(url, timeout=PAGE_TIMEOUT)
+            except Exception as e:
+                LOG.debug("Fetch of %s failed (%d): %s", url, attempt, e)
+                continue
+            if response.status_code == 200:
+                return day, 200, response.content
+            if response.status_code < 500:
+                return day, response.status_code, b""
+        return day, None, b""
+
+    def run(self, on_progress=None, end=None):
+        """Backfill up to `end` (today). Returns the number of new entries."""
+        days = self.pending_dates(end)
+        total = len(days)
+        LOG.info("Backfill of %d date(s) from %s", total,
+                 date_str(days[0]) if days else "-")
+        if not days:
+            return 0
+        done = 0
+        with ThreadPoolExecutor(max_workers=self.workers) as fetcher:
+            for first in range(0, total, BATCH_DAYS):
+                if self.cancelled:
+                    break
+                batch = days[first:first + BATCH_DAYS]
+                pages = list(fetcher.map(self.fetch, batch))
+                self.store_batch(pages)
+                done += len(batch)
+                self.save_checkpoint(date_str(batch[-1]))
+                if on_progress is not None:
+                    try:
+                        on_progress(done, total)
+                    except Exception as e:
+                        LOG.error("Backfill progress callback: %s", e)
+        LOG.info("Backfill %s: %d stored, %d failed, %d missing",
+                 "stopped" if self.cancelled else "done",
+                 self.stored, self.failed, len(self.missing))
+        return self.stored
+
+    def store_batch(self, pages):
+        found = []
+        # yesterday's page, Eastern time, may not be published yet either
+        settled = eastern_now().date() - timedelta(days=1)
+        for day, status, data in pages:
+            if status == 200:
+                found.append((data, day))
+            elif status == 404:
+                if day < settled:
+                    self.missing[date_str(day)] = time.time()
+            else:
+                # network error or 5xx: retried by the next run
+                self.failed += 1
+        if not found:
+            return
+        good = []
+        for (_data, day), props in zip(
+                found, parse_pages(found)):
+            if props is None:
+                self.unparsable.add(date_str(day))
+            else:
+                good.append(normalize(props))
+        self.stored += self.store.put_entries(good)
@@ -0,0 +1,280 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""
+APOD - Astronomy Picture of the Day Plugin
+Content addressed image store
+
+Images are stored once under blobs/, named after the SHA-1 of their
+bytes. A small SQLite map turns an image url into its blob (hash of the
+url, then of the bytes), and an APOD date into the url shown for it, so:
+
+- an image already downloaded for any screen or date is never fetched
+  again, whoever asks for it next (splash, archive, detail, prefetch);
+- re-runs published under another date, or the same picture behind two
+  urls, share one file on disk.
+
+Downloads land on a per-url staging file first and are moved to their
+content address once complete (see commit()). Concurrent fetch() calls for
+one url share a single download. fetch() keeps the SQLite map off the
+reactor thread; lookup() and commit() block.
+"""
+
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+from os import makedirs, remove, rename
+from os.path import exists, join, splitext
+from urllib.parse import urlparse
+
+from twisted.internet import defer, threads
+from twisted.python.failure import Failure
+
+from . import CACHE_DIR
+from .apod_cache import forget, record, touch
+from .apod_download import get_engine
+from .apod_http import drop_validators
+
+LOG = logging.getLogger(__name__)
+
+BLOB_FOLDER = "blobs"
+MAP_NAME = "blob_map.db"
+HASH_CHUNK = 64 * 1024
+
+_SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS urls (
+        url TEXT PRIMARY KEY,
+        blob TEXT NOT NULL,
+        stored REAL NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS urls_blob ON urls (blob)",
+    """
+    CREATE TABLE IF NOT EXISTS dates (
+        date TEXT PRIMARY KEY,
+        url TEXT NOT NULL
+    )
+    """
+)
+
+
+def url_ext(url):
+    return splitext(urlparse(url).path)[1].lower() or ".jpg"
+
+
+def file_digest(path):
+    """SHA-1 of a file, read in chunks."""
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class _SharedFetch:
+    """One download of a url, shared by every fetch() waiting for it."""
+
+    def __init__(self, store, url, day):
+        self.store = store
+        self.url = url
+        self.day = day
+        self.waiters = []
+        self.download = None
+
+    def start(self):
+        # the url map is SQLite: looked up off the reactor thread
+        self.download = threads.deferToThread(self.store.lookup, self.url)
+        self.download.addCallback(self.stored)
+        self.download.addBoth(self.done)
+
+    def stored(self, path):
+        """Blob path when the url was stored already, else download it."""
+        if path is not None:
+            if self.day:
+                self.link(self.day)
+            return path
+        staging = self.store.staging_path(self.url)
+        download = get_engine().download(self.url, staging, self.progress)
+        download.addCallback(lambda result: threads.deferToThread(
+            self.store.commit, self.url, staging, self.day))
+        return download
+
+    def link(self, day):
+        """Map `day` to the url, in a worker thread."""
+        threads.deferToThread(self.store.link_date, day, self.url).addErrback(
+            lambda failure: LOG.warning("Unable to link %s to %s: %s", day,
+                                        self.url, failure.getErrorMessage()))
+
+    def wait(self, day=None, progress=None):
+        d = defer.Deferred(canceller=self.cancel)
+        self.waiters.append((d, day, progress))
+        return d
+
+    def progress(self, *args):
+        for _d, _day, progress in list(self.waiters):
+            if progress is not None:
+                progress(*args)
+
+    def cancel(self, d):
+        # only the last waiter going away aborts the download
+        self.waiters = [w for w in self.waiters if w[0] is not d]
+        if not self.waiters:
+            self.forget()
+            self.download.cancel()
+
+    def forget(self):
+        if self.store._fetching.get(self.url) is self:
+            del self.store._fetching[self.url]
+
+    def done(self, result):
+        self.forget()
+        waiters, self.waiters = self.waiters, []
+        for d, day, _progress in waiters:
+            if d.called:
+                continue
+            if isinstance(result, Failure):
+                d.errback(result)
+                continue
+            if day and day != self.day:
+                self.link(day)
+            d.callback(result)
+
+
+class BlobStore:
+    """Image files keyed by content, with url and date maps."""
+
+    def __init__(self, cache_dir=CACHE_DIR):
+        self.folder = join(cache_dir, BLOB_FOLDER)
+        if not exists(self.folder):
+            makedirs(self.folder)
+        self._lock = threading.Lock()
+        # url -> _SharedFetch, reactor thread only
+        self._fetching = {}
+        self._conn = sqlite3.connect(
+            join(cache_dir, MAP_NAME), check_same_thread=False)
+        with self._lock:
+            for statement in _SCHEMA:
+                self._conn.execute(statement)
+            self._conn.commit()
+
+    def lookup(self, url):
+        """Blob path of `url` if it is stored, else None."""
+        if not url:
+            return None
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT blob FROM urls WHERE url = ?", (url,)).fetchone()
+        if row is None:
+            return None
+        path = join(self.folder, row[0])
+        if not exists(path):
+            # evicted from the cache meanwhile
+            self.forget(url)
+            return None
+        touch(path)
+        return path
+
+    def staging_path(self, url, tag=""):
+        """
+        Where a download of `url` is written before commit(). Downloaders
+        other than fetch() pass a `tag` so they never share its file.
+        """
+        return join(self.folder, "url-{}{}{}".format(
+            hashlib.md5(url.encode("utf-8")).hexdigest(), tag, url_ext(url)))
+
+    def commit(self, url, path, day=None):
+        """
+        Move a completed download to its content address and map `url`
+        (and `day`) to it. A blob with the same bytes is reused and the
+        download dropped. Blocking: hashes the file.
+        """
+        stored = self.lookup(url)
+        if stored is not None:
+            # another downloader of the same url committed first
+            if exists(path):
+                remove(path)
+            drop_validators(path)
+            forget(path)
+            if day:
+                self.link_date(day, url)
+            return stored
+        name = "{}{}".format(file_digest(path), url_ext(url))
+        blob = join(self.folder, name)
+        if exists(blob):
+            LOG.debug("Duplicate of %s: %s", name, url)
+            remove(path)
+        else:
+            rename(path, blob)
+            record(blob)
+        drop_validators(path)
+        forget(path)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO urls (url, blob, stored) "
+                "VALUES (?, ?, ?)", (url, name, time.time()))
+            if day:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO dates (date, url) VALUES (?, ?)",
+                    (day, url))
+            self._conn.commit()
+        return blob
+
+    def link_date(self, day, url):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO dates (date, url) VALUES (?, ?)",
+                (day, url))
+            self._conn.commit()
+
+    def latest(self):
+        """(date, url, path) of the newest date whose image is stored."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT dates.date, dates.url, urls.blob FROM dates "
+                "JOIN urls ON urls.url = dates.url "
+                "ORDER BY dates.date DESC LIMIT 5").fetchall()
+        for day, url, name in rows:
+            path = join(self.folder, name)
+            if exists(path):
+                return day, url, path
+        return None
+
+    def forget(self, url):
+        with self._lock:
+            self._conn.execute("DELETE FROM urls WHERE url = ?", (url,))
+            self._conn.commit()
+
+    def fetch(self, url, day=None, progress=None):
+        """
+        Deferred firing with the blob path of `url`, downloading it
+        through the shared engine only when it is not stored yet; callers
+        asking for a url already looked up or downloading share that job.
+        Cancelling it aborts the download once nobody else waits for it.
+        """
+        job = self._fetching.get(url)
+        if job is not None:
+            return job.wait(day, progress)
+        job = self._fetching[url] = _SharedFetch(self, url, day)
+        d = job.wait(day, progress)
+        # after wait(): a download failing at once still reaches `d`
+        job.start()
+        return d
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_blobs = None
+_blobs_lock = threading.Lock()
+
+
+def get_blobs():
+    """Return the shared BlobStore, creating it on first use."""
+    global _blobs
+    with _blobs_lock:
+        if _blobs is None:
+            _blobs = BlobStore()
+        return _blobs
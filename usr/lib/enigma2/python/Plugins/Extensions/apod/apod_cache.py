@@ -0,0 +1,298 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""
+APOD - Astronomy Picture of the Day Plugin
+Cache index and eviction
+
+Every file the plugin writes to the cache is recorded in a small SQLite
+index (path, kind, size, last access) and every hit refreshes its access
+time. The byte total of each kind (image, thumb, page, json) is kept in
+memory, so checking the budgets costs nothing and eviction walks the
+least recently used rows of the kind that is over budget: the cost is
+proportional to what is evicted, never a scan of the cache folder.
+
+Eviction runs on a background worker, requested automatically whenever a
+write pushes a kind past its budget or leaves the cache filesystem with
+less than MIN_FREE_SPACE bytes.
+"""
+
+import logging
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from os import chmod, close, makedirs, remove, rename
+from os.path import basename, dirname, exists, getsize, join
+from tempfile import mkstemp
+
+from . import CACHE_DIR, MIN_FREE_SPACE, free_space
+
+LOG = logging.getLogger(__name__)
+
+INDEX_NAME = "cache_index.db"
+META_SUFFIX = ".meta"
+EVICT_BATCH = 32
+MB = 1024 * 1024
+
+KIND_IMAGE = "image"
+KIND_THUMB = "thumb"
+KIND_PAGE = "page"
+KIND_JSON = "json"
+
+DEFAULT_BUDGETS = {
+    KIND_IMAGE: 64 * MB,
+    KIND_THUMB: 8 * MB,
+    KIND_PAGE: 8 * MB,
+    KIND_JSON: 4 * MB
+}
+
+_SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS files (
+        path TEXT PRIMARY KEY,
+        kind TEXT NOT NULL,
+        size INTEGER NOT NULL,
+        accessed REAL NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS files_lru ON files (kind, accessed)",
+    "CREATE INDEX IF NOT EXISTS files_age ON files (accessed)"
+)
+
+
+def temp_file(path):
+    """
+    Create an empty temp file next to `path` for a writer that renames it
+    into place. Every call gets its own file: concurrent writers of one
+    path never mix their bytes, the last rename wins.
+    """
+    fd, tmp_path = mkstemp(
+        prefix="." + basename(path) + ".", suffix=".tmp",
+        dir=dirname(path) or ".")
+    close(fd)
+    # mkstemp creates the file private
+    chmod(tmp_path, 0o644)
+    return tmp_path
+
+
+def drop_temp(tmp_path):
+    """Remove the temp file of a failed write."""
+    if exists(tmp_path):
+        try:
+            remove(tmp_path)
+        except OSError:
+            pass
+
+
+def atomic_write(path, data, mode="w", **kwargs):
+    """Write `data` through a temp file and rename, so readers never see
+    half a file."""
+    tmp_path = temp_file(path)
+    try:
+        with open(tmp_path, mode, **kwargs) as f:
+            f.write(data)
+        rename(tmp_path, path)
+    except Exception:
+        drop_temp(tmp_path)
+        raise
+
+
+def kind_for(path):
+    """Guess the cache kind of a file from its location and name."""
+    if "/thumbs/" in path:
+        return KIND_THUMB
+    if "/pages/" in path:
+        return KIND_PAGE
+    if path.endswith(".json"):
+        return KIND_JSON
+    return KIND_IMAGE
+
+
+class CacheIndex:
+    """Persistent LRU index of the cache folder with per-kind budgets."""
+
+    def __init__(self, cache_dir=CACHE_DIR, budgets=None):
+        self.cache_dir = cache_dir
+        self.budgets = dict(DEFAULT_BUDGETS)
+        self.budgets.update(budgets or {})
+        self._lock = threading.Lock()
+        self._touched = {}
+        self._worker = ThreadPoolExecutor(max_workers=1)
+        self._cleanup_pending = False
+        if not exists(cache_dir):
+            makedirs(cache_dir)
+        self._conn = sqlite3.connect(
+            join(cache_dir, INDEX_NAME), check_same_thread=False)
+        with self._lock:
+            for statement in _SCHEMA:
+                self._conn.execute(statement)
+            self._conn.commit()
+            self.usage = dict(self._conn.execute(
+                "SELECT kind, SUM(size) FROM files GROUP BY kind"))
+
+    def set_budgets(self, budgets):
+        self.budgets.update(budgets)
+        self.request_cleanup()
+
+    def owns(self, path):
+        return path.startswith(self.cache_dir)
+
+    def record(self, path, kind=None):
+        """Register a file just written to the cache."""
+        if not self.owns(path):
+            return
+        try:
+            size = getsize(path)
+        except OSError:
+            return
+        kind = kind or kind_for(path)
+        with self._lock:
+            self._touched.pop(path, None)
+            row = self._conn.execute(
+                "SELECT kind, size FROM files WHERE path = ?",
+                (path,)).fetchone()
+            if row is not None:
+                self.usage[row[0]] = self.usage.get(row[0], 0) - row[1]
+            self._conn.execute(
+                "INSERT OR REPLACE INTO files (path, kind, size, accessed) "
+                "VALUES (?, ?, ?, ?)", (path, kind, size, time.time()))
+            self._conn.commit()
+            self.usage[kind] = self.usage.get(kind, 0) + size
+            over = self.usage[kind] > self.budgets.get(kind, 0)
+        if over or self.low_space():
+            self.request_cleanup()
+
+    def touch(self, path):
+        """Note a cache hit; written to the index with the next flush."""
+        if self.owns(path):
+            self._touched[path] = time.time()
+
+    def forget(self, path):
+        with self._lock:
+            self._forget(path)
+            self._conn.commit()
+
+    def _forget(self, path):
+        row = self._conn.execute(
+            "SELECT kind, size FROM files WHERE path = ?", (path,)).fetchone()
+        if row is not None:
+            self.usage[row[0]] = self.usage.get(row[0], 0) - row[1]
+            self._conn.execute("DELETE FROM files WHERE path = ?", (path,))
+
+    def _flush_touched(self):
+        touched, self._touched = self._touched, {}
+        if touched:
+            self._conn.executemany(
+                "UPDATE files SET accessed = ? WHERE path = ?",
+                [(when, path) for path, when in touched.items()])
+
+    def over_budget(self):
+        return [kind for kind, size in self.usage.items()
+                if size > self.budgets.get(kind, 0)]
+
+    def low_space(self):
+        return free_space(self.cache_dir) < MIN_FREE_SPACE
+
+    def request_cleanup(self):
+        """Run evict() on the background worker unless already queued."""
+        with self._lock:
+            if self._cleanup_pending or not (
+                    self.over_budget() or self.low_space()):
+                return
+            self._cleanup_pending = True
+        self._worker.submit(self._cleanup)
+
+    def _cleanup(self):
+        try:
+            self.evict()
+        except Exception as e:
+            LOG.error("Cache cleanup failed: %s", e)
+        finally:
+            self._cleanup_pending = False
+
+    def evict(self):
+        """Remove least recently used files until every kind fits."""
+        removed = 0
+        with self._lock:
+            self._flush_touched()
+            for kind in self.over_budget():
+                budget = self.budgets.get(kind, 0)
+                while self.usage.get(kind, 0) > budget:
+                    rows = self._conn.execute(
+                        "SELECT path FROM files WHERE kind = ? "
+                        "ORDER BY accessed LIMIT ?",
+                        (kind, EVICT_BATCH)).fetchall()
+                    if not rows:
+                        self.usage[kind] = 0
+                        break
+                    for (path,) in rows:
+                        if self.usage.get(kind, 0) <= budget:
+                            break
+                        self._remove_file(path)
+                        self._forget(path)
+                        removed += 1
+            # the filesystem is shared (tmpfs is RAM): whatever the
+            # budgets, leave it some room
+            while self.low_space():
+                row = self._conn.execute(
+                    "SELECT path FROM files ORDER BY accessed LIMIT 1"
+                ).fetchone()
+                if row is None:
+                    break
+                self._remove_file(row[0])
+                self._forget(row[0])
+                removed += 1
+            self._conn.commit()
+        if removed:
+            LOG.info("Evicted %d cache file(s)", removed)
+        return removed
+
+    def _remove_file(self, path):
+        for name in (path, path + META_SUFFIX):
+            if exists(name):
+                try:
+                    remove(name)
+                except OSError as e:
+                    LOG.warning("Unable to evict %s: %s", name, e)
+
+    def close(self):
+        self._worker.shutdown(wait=False)
+        with self._lock:
+            self._flush_touched()
+            self._conn.commit()
+            self._conn.close()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """Return the shared CacheIndex, creating it on first use."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = CacheIndex()
+        return _cache
+
+
+def record(path, kind=None):
+    """Index a cache write; never lets an index error break a download."""
+    try:
+        get_cache().record(path, kind)
+    except Exception as e:
+        LOG.debug("Cache index update failed for %s: %s", path, e)
+
+
+def forget(path):
+    try:
+        get_cache().forget(path)
+    except Exception as e:
+        LOG.debug("Cache index update failed for %s: %s", path, e)
+
+
+def touch(path):
+    try:
+        get_cache().touch(path)
+    except Exception as e:
+        LOG.debug("Cache index update failed for %s: %s", path, e)
@@ -0,0 +1,232 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""
+APOD - Astronomy Picture of the Day Plugin
+Daily background prefetch
+
+NASA publishes the new APOD around midnight US Eastern time. Shortly after
+that, and once after the GUI starts if today's entry is missing, the
+scheduler fetches the new entry into the metadata store, downloads its
+images into the image store, pre-scales them at the sizes the screens use
+and translates its texts, so the first open of the day is served locally.
+
+Nothing runs while the receiver is in standby (the run is postponed until
+it wakes up) or while it has no default route; failed runs are retried a
+few times before waiting for the next day.
+"""
+
+import logging
+from datetime import datetime, timedelta
+
+from twisted.internet import defer, reactor, threads
+
+from .apod_blobs import get_blobs
+from .apod_download import get_engine
+from .apod_fetcher import APOD_API_URL
+from .apod_images import ThumbnailLoader, scale_image, thumb_source
+from .apod_store import date_str, get_store
+from .google_translate import save_cache_to_disk, trans
+
+try:
+    from zoneinfo import ZoneInfo
+    EASTERN = ZoneInfo("America/New_York")
+except Exception:
+    EASTERN = None
+
+LOG = logging.getLogger(__name__)
+
+# minutes after US Eastern midnight, once NASA has published
+PUBLISH_DELAY = 20
+STARTUP_DELAY = 120
+RETRY_DELAY = 30 * 60
+MAX_RETRIES = 4
+ROUTE_FILE = "/proc/net/route"
+
+
+def eastern_now():
+    """Current US Eastern time (fixed UTC-5 without a tz database)."""
+    if EASTERN is not None:
+        return datetime.now(EASTERN).replace(tzinfo=None)
+    return datetime.utcnow() - timedelta(hours=5)
+
+
+def seconds_to_next_run():
+    """Seconds from now to PUBLISH_DELAY minutes past Eastern midnight."""
+    now = eastern_now()
+    run = now.replace(hour=0, minute=PUBLISH_DELAY, second=0, microsecond=0)
+    if run <= now:
+        run += timedelta(days=1)
+    return max(60, (run - now).total_seconds())
+
+
+def network_up():
+    """True when the kernel has a default route."""
+    try:
+        with open(ROUTE_FILE) as f:
+            for line in f.readlines()[1:]:
+                fields = line.split()
+                if len(fields) > 1 and fields[1] == "00000000":
+                    return True
+    except IOError:
+        # no procfs: let the request decide
+        return True
+    return False
+
+
+def in_standby():
+    try:
+        from Screens.Standby import inStandby
+        return inStandby is not None
+    except ImportError:
+        return False
+
+
+class DailyPrefetch:
+    """
+    Background job warming the caches with the newest APOD.
+
+    `api_key` is a callable returning the configured key and `enabled`
+    one returning whether the prefetch is switched on; `image_sizes`
+    are the widget sizes images are pre-scaled to and `thumb_size` the
+    archive row thumbnail size.
+    """
+
+    def __init__(self, api_key, image_sizes, thumb_size, cache_dir,
+                 enabled=lambda: True):
+        self.api_key = api_key
+        self.enabled = enabled
+        self.image_sizes = image_sizes
+        self.thumb_size = thumb_size
+        self.cache_dir = cache_dir
+        self.call = None
+        self.running = False
+        self.retries = 0
+        self.postponed = False
+
+    def start(self):
+        """Schedule the first run: soon if today's entry is missing."""
+        today = date_str(eastern_now().date())
+        newest = get_store().newest_date()
+        if newest is None or date_str(newest) < today:
+            self.schedule(STARTUP_DELAY)
+        else:
+            self.schedule(seconds_to_next_run())
+
+    def stop(self):
+        if self.call is not None and self.call.active():
+            self.call.cancel()
+        self.call = None
+
+    def schedule(self, delay):
+        self.stop()
+        LOG.info("Daily prefetch in %d s", delay)
+        self.call = reactor.callLater(delay, self.run)
+
+    def leave_standby(self):
+        if self.postponed:
+            self.postponed = False
+            self.schedule(STARTUP_DELAY)
+
+    def run(self):
+        self.call = None
+        if self.running:
+            return
+        if not self.enabled():
+            # switched off meanwhile: start() schedules it again
+            LOG.info("Daily prefetch disabled")
+            return
+        key = self.api_key()
+        if not key or key == "DEMO_KEY":
+            self.schedule(seconds_to_next_run())
+            return
+        if in_standby():
+            LOG.info("Daily prefetch postponed: receiver in standby")
+            self.postponed = True
+            self.watch_standby()
+            return
+        if not network_up():
+            self.failed("no network")
+            return
+        self.running = True
+        d = get_engine().get_json(APOD_API_URL, {"api_key": key})
+        d.addCallback(self.warm)
+        d.addCallbacks(self.succeeded, self.failed)
+
+    def watch_standby(self):
+        try:
+            from Screens.Standby import inStandby
+            if inStandby is not None and \
+                    self.leave_standby not in inStandby.onClose:
+                inStandby.onClose.append(self.leave_standby)
+        except ImportError:
+            pass
+
+    @defer.inlineCallbacks
+    def warm(self, data):
+        """Store the entry, its images, scaled copies and translations."""
+        if isinstance(data, list):
+            data = data[0]
+        day = data.get("date")
+        yield threads.deferToThread(get_store().put_entries, [data])
+        LOG.info("Daily prefetch of %s: %s", day, data.get("title"))
+        if data.get("media_type", "image") == "image":
+            blobs = get_blobs()
+            for url in (data.get("url"), data.get("hdurl")):
+                if not url:
+                    continue
+                path = yield blobs.fetch(url, day)
+                for size in self.image_sizes:
+                    yield threads.deferToThread(scale_image, path, size)
+        yield self.build_thumbnail(data)
+        yield threads.deferToThread(self.translate, data)
+
+    def build_thumbnail(self, data):
+        url = thumb_source(data)
+        if not url:
+            return None
+        loader = ThumbnailLoader(self.cache_dir, self.thumb_size, workers=1)
+        if not loader.available or loader.cached(url):
+            loader.close()
+            return None
+        d = defer.Deferred()
+
+        def ready(url, path):
+            if not d.called:
+                d.callback(path)
+
+        loader.request(url, ready)
+        # a failed thumbnail never calls back: do not wait for it forever
+        timeout = reactor.callLater(60, d.callback, None)
+
+        def done(result):
+            if timeout.active():
+                timeout.cancel()
+            loader.close()
+            return result
+
+        return d.addBoth(done)
+
+    def translate(self, data):
+        for field in ("title", "explanation"):
+            if data.get(field):
+                trans(data[field])
+        save_cache_to_disk()
+
+    def succeeded(self, result):
+        self.running = False
+        self.retries = 0
+        self.schedule(seconds_to_next_run())
+
+    def failed(self, reason):
+        self.running = False
+        message = getattr(reason, "value", reason)
+        if self.retries < MAX_RETRIES:
+            self.retries += 1
+            LOG.warning("Daily prefetch failed (%s), retry %d in %d s",
+                        message, self.retries, RETRY_DELAY)
+            self.schedule(RETRY_DELAY)
+        else:
+            LOG.error("Daily prefetch failed (%s), next run tomorrow",
+                      message)
+            self.retries = 0
+            self.schedule(seconds_to_next_run())
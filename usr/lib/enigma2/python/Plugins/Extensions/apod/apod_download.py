@@ -0,0 +1,411 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""
+APOD - Astronomy Picture of the Day Plugin
+Non-blocking download engine
+
+Downloads run on the reactor with twisted.web.client.Agent and a
+persistent HTTPConnectionPool: nothing blocks the GUI and nothing
+occupies the reactor thread pool, so concurrent downloads are bounded
+only by the per-host connection limit. Bodies are streamed straight to a
+".part" file next to the target and renamed into place once its size
+matches what the server announced. An interrupted transfer keeps its
+.part file: the next attempt (automatic retries, or a later visit) asks
+only for the missing bytes with an HTTP Range request guarded by
+If-Range, so a large HD image on a slow link finishes instead of
+restarting from zero. Progress is reported through a callback while the
+returned Deferred fires with the result.
+
+Conditional requests and the url allow-list are shared with apod_http.
+"""
+
+import logging
+import re
+import time
+from json import loads
+from os import remove, rename
+from os.path import exists, getsize
+from urllib.parse import urlencode, urljoin
+
+from twisted.internet import defer, reactor, task
+from twisted.internet.protocol import Protocol
+from twisted.python.failure import Failure
+from twisted.web.client import (
+    Agent,
+    HTTPConnectionPool,
+    PartialDownloadError,
+    ResponseDone,
+    readBody
+)
+from twisted.web.http import PotentialDataLoss
+from twisted.web.http_headers import Headers
+
+from . import HEADERS
+from .apod_cache import record, touch
+from .apod_http import (
+    SecurityError,
+    conditional_headers,
+    drop_validators,
+    load_validators,
+    save_validators,
+    validate_url
+)
+
+LOG = logging.getLogger(__name__)
+
+CONNECT_TIMEOUT = 15
+MAX_PER_HOST = 4
+IDLE_TIMEOUT = 120
+PROGRESS_INTERVAL = 0.5
+PART_SUFFIX = ".part"
+DOWNLOAD_RETRIES = 3
+RETRY_DELAY = 2
+MAX_REDIRECTS = 5
+REDIRECT_CODES = (301, 302, 303, 307, 308)
+
+CONTENT_RANGE = re.compile(r"bytes (\d+)-(\d+)/(\d+|\*)")
+
+
+class DownloadHTTPError(IOError):
+    """The server answered with an error status."""
+
+    def __init__(self, url, code, body=b""):
+        IOError.__init__(self, "HTTP {} for {}".format(code, url))
+        self.url = url
+        self.code = code
+        self.body = body
+
+
+def remove_file(path):
+    if exists(path):
+        try:
+            remove(path)
+        except OSError:
+            pass
+
+
+def drop_part(path):
+    """Forget the partial download of `path`."""
+    remove_file(path + PART_SUFFIX)
+    drop_validators(path + PART_SUFFIX)
+
+
+def response_headers(response):
+    """Plain dict of the response headers used by the validators."""
+    headers = {}
+    for name in ("ETag", "Last-Modified", "Content-Length",
+                 "Content-Encoding", "Content-Range"):
+        values = response.headers.getRawHeaders(name)
+        if values:
+            headers[name] = values[-1]
+    return headers
+
+
+class _FileReceiver(Protocol):
+    """Stream a response body into `tmp_path`, reporting progress."""
+
+    def __init__(self, tmp_path, finished, total, progress, offset=0):
+        self.tmp_path = tmp_path
+        self.finished = finished
+        self.total = total
+        self.progress = progress
+        self.offset = offset
+        self.received = offset
+        self.started = time.time()
+        self.reported = 0
+        # resumed transfers append to the bytes already on disk
+        self.file = open(tmp_path, "ab" if offset else "wb")
+
+    def dataReceived(self, data):
+        self.file.write(data)
+        self.received += len(data)
+        if self.progress is not None:
+            now = time.time()
+            if now - self.reported >= PROGRESS_INTERVAL:
+                self.reported = now
+                rate = (self.received - self.offset) / max(
+                    now - self.started, 0.001)
+                try:
+                    self.progress(self.received, self.total, rate)
+                except Exception as e:
+                    LOG.debug("Progress callback failed: %s", e)
+
+    def connectionLost(self, reason):
+        self.file.close()
+        if reason.check(ResponseDone, PotentialDataLoss):
+            self.finished.callback(self.received)
+        else:
+            self.finished.errback(reason)
+
+    def stop(self):
+        if self.transport is not None:
+            self.transport.stopProducing()
+
+
+class DownloadEngine:
+    """Reactor based downloader with a persistent connection pool."""
+
+    def __init__(self, max_per_host=MAX_PER_HOST):
+        self.pool = HTTPConnectionPool(reactor, persistent=True)
+        self.pool.maxPersistentPerHost = max_per_host
+        self.pool.cachedConnectionTimeout = IDLE_TIMEOUT
+        # no RedirectAgent: request() checks every hop against the
+        # allow-list itself
+        self.agent = Agent(
+            reactor, connectTimeout=CONNECT_TIMEOUT, pool=self.pool)
+
+    def request(self, url, headers=None, redirects=MAX_REDIRECTS):
+        """
+        Deferred firing with the twisted Response for a GET of `url`,
+        following up to `redirects` redirects to allowed urls only.
+        """
+        if not validate_url(url):
+            return defer.fail(SecurityError("Invalid URL: {}".format(url)))
+        raw_headers = Headers()
+        for name, value in (headers or {}).items():
+            raw_headers.setRawHeaders(name, [value])
+
+        def follow(response):
+            location = response.headers.getRawHeaders(b"location")
+            if response.code not in REDIRECT_CODES or not location:
+                return response
+            response.deliverBody(_Discard())
+            if redirects <= 0:
+                raise IOError("Too many redirects for {}".format(url))
+            target = urljoin(url, location[0].decode("latin1"))
+            LOG.debug("Redirect %d: %s -> %s", response.code, url, target)
+            return self.request(target, headers, redirects - 1)
+
+        d = self.agent.request(
+            b"GET", url.encode("ascii"), raw_headers, None)
+        return d.addCallback(follow)
+
+    def get_bytes(self, url, params=None, headers=None):
+        """Deferred firing with (code, body) of a small response."""
+        if params:
+            url = "{}?{}".format(url, urlencode(params))
+
+        def got_response(response):
+
+            def partial(failure):
+                # servers closing without Content-Length still sent it all
+                failure.trap(PartialDownloadError)
+                return (response.code, failure.value.response)
+
+            d = readBody(response)
+            d.addCallback(lambda body: (response.code, body))
+            d.addErrback(partial)
+            return d
+
+        return self.request(url, headers).addCallback(got_response)
+
+    def get_json(self, url, params=None):
+        """Deferred firing with the decoded JSON body of `url`."""
+
+        def decode(result):
+            code, body = result
+            if code != 200:
+                raise DownloadHTTPError(url, code, body[:200])
+            return loads(body.decode("utf-8"))
+
+        return self.get_bytes(
+            url, params, {"Accept": "application/json"}).addCallback(decode)
+
+    def download(self, url, path, progress=None, headers=None,
+                 retries=DOWNLOAD_RETRIES):
+        """
+        Stream `url` into `path`, revalidating an existing copy with the
+        stored ETag / Last-Modified. Fires with (code, modified); modified
+        is False on a 304. progress(received, total, bytes_per_second) is
+        called while the body arrives. Interrupted transfers are resumed
+        up to `retries` times. Cancelling the Deferred aborts the transfer;
+        the .part file is kept so a later download resumes it.
+        """
+        state = {"attempt": None}
+
+        def cancel(d):
+            if state["attempt"] is not None:
+                state["attempt"].cancel()
+
+        result = defer.Deferred(canceller=cancel)
+
+        def run(tries_left):
+            attempt = self._attempt(url, path, progress, headers)
+            state["attempt"] = attempt
+            attempt.addCallbacks(done, failed, errbackArgs=(tries_left,))
+
+        def done(value):
+            state["attempt"] = None
+            if not result.called:
+                result.callback(value)
+
+        def failed(failure, tries_left):
+            state["attempt"] = None
+            if result.called:
+                # cancelled meanwhile
+                return
+            error = failure.value
+            fatal = isinstance(error, (SecurityError, defer.CancelledError))
+            if isinstance(error, DownloadHTTPError) and error.code < 500:
+                fatal = True
+            if fatal or tries_left <= 0:
+                result.errback(failure)
+                return
+            LOG.warning("Download of %s interrupted (%s), resuming",
+                        url, failure.getErrorMessage())
+            state["attempt"] = task.deferLater(
+                reactor, RETRY_DELAY, run, tries_left - 1)
+
+        run(retries)
+        return result
+
+    def _resume_headers(self, path, url, headers):
+        """Range headers continuing a .part file, or None to start over."""
+        part_path = path + PART_SUFFIX
+        if not exists(part_path):
+            return None
+        meta = load_validators(part_path, url, check_size=False)
+        etag = meta.get("etag")
+        # If-Range needs a strong validator
+        validator = etag if etag and not etag.startswith("W/") else \
+            meta.get("last_modified")
+        offset = getsize(part_path)
+        if not validator or not offset:
+            drop_part(path)
+            return None
+        request_headers = dict(HEADERS)
+        request_headers.update(headers or {})
+        request_headers["Range"] = "bytes={}-".format(offset)
+        request_headers["If-Range"] = validator
+        return request_headers
+
+    def _attempt(self, url, path, progress, headers):
+        """One GET of `url`, resuming the .part file when possible."""
+        part_path = path + PART_SUFFIX
+        request_headers = self._resume_headers(path, url, headers)
+        resuming = request_headers is not None
+        if not resuming:
+            request_headers = conditional_headers(path, url, headers)
+        receiver = []
+
+        def cancel(d):
+            if receiver:
+                receiver[0].stop()
+            elif not started.called:
+                started.cancel()
+
+        result = defer.Deferred(canceller=cancel)
+
+        def got_response(response):
+            if response.code == 304 and exists(path):
+                LOG.debug("Not modified: %s", url)
+                response.deliverBody(_Discard())
+                touch(path)
+                return (304, False)
+            if response.code == 416 and resuming:
+                # the .part does not match the file any more
+                response.deliverBody(_Discard())
+                drop_part(path)
+                raise IOError("Range not satisfiable for {}".format(url))
+            if response.code >= 400:
+                response.deliverBody(_Discard())
+                raise DownloadHTTPError(url, response.code)
+            headers = response_headers(response)
+            offset = 0
+            total = response.length
+            if not isinstance(total, int):
+                total = None
+            if response.code == 206:
+                match = CONTENT_RANGE.match(headers.get("Content-Range", ""))
+                if not match or int(match.group(1)) != getsize(part_path):
+                    response.deliverBody(_Discard())
+                    drop_part(path)
+                    raise IOError("Unexpected range for {}".format(url))
+                offset = int(match.group(1))
+                total = None if match.group(3) == "*" else int(match.group(3))
+                LOG.info("Resuming %s at %d bytes", url, offset)
+            elif resuming:
+                LOG.debug("Server sent the whole file for %s", url)
+            if total is not None:
+                headers["Content-Length"] = str(total)
+            # remember what the .part belongs to, for If-Range
+            save_validators(part_path, url, headers)
+            finished = defer.Deferred()
+            receiver.append(
+                _FileReceiver(part_path, finished, total, progress, offset))
+            response.deliverBody(receiver[0])
+
+            def complete(received):
+                if total is not None and received != total:
+                    raise IOError("Short read for {}: {} of {} bytes".format(
+                        url, received, total))
+                drop_validators(path)
+                drop_validators(part_path)
+                rename(part_path, path)
+                save_validators(path, url, headers)
+                record(path)
+                return (response.code, True)
+
+            return finished.addCallback(complete)
+
+        def forward(value):
+            # a cancelled transfer has already fired `result`: its
+            # connection going down later must not fire it again
+            if result.called:
+                if isinstance(value, Failure):
+                    LOG.debug("Cancelled download of %s ended: %s",
+                              url, value.getErrorMessage())
+                return None
+            if isinstance(value, Failure):
+                result.errback(value)
+            else:
+                result.callback(value)
+            return None
+
+        started = self.request(url, request_headers)
+        started.addCallback(got_response)
+        started.addBoth(forward)
+        return result
+
+    def close(self):
+        return self.pool.closeCachedConnections()
+
+
+class _Discard(Protocol):
+    """Drain a response body nobody needs."""
+
+    def connectionLost(self, reason):
+        pass
+
+
+_engine = None
+
+
+def get_engine():
+    """Return the shared DownloadEngine (reactor thread only)."""
+    global _engine
+    if _engine is None:
+        _engine = DownloadEngine()
+    return _engine
+
+
+def run_in_executor(executor, func, *args):
+    """
+    Run func(*args) on a concurrent.futures executor and return a Deferred
+    firing on the reactor thread with its result. Keeps CPU work such as
+    image scaling off the (small) reactor thread pool.
+    """
+    d = defer.Deferred()
+
+    def done(future):
+        if future.cancelled():
+            reactor.callFromThread(d.cancel)
+            return
+        error = future.exception()
+        if error is not None:
+            reactor.callFromThread(d.errback, error)
+        else:
+            reactor.callFromThread(d.callback, future.result())
+
+    executor.submit(func, *args).add_done_callback(done)
+    return d
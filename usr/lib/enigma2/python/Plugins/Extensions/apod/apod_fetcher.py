@@ -0,0 +1,213 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""
+APOD - Astronomy Picture of the Day Plugin
+NASA APOD API fetcher
+
+Large date ranges (and large random counts) are split into chunks that run
+on a small bounded thread pool sharing the plugin's pooled HttpClient
+(apod_http), so every chunk re-uses the same keep-alive connections.
+Results are merged and de-duplicated by date, and only the chunks that
+failed are retried, so one bad chunk never loses the others.
+"""
+
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date, timedelta
+
+from .apod_http import get_client
+from .apod_store import date_chunks, date_str
+
+LOG = logging.getLogger(__name__)
+
+APOD_API_URL = "https://api.nasa.gov/planetary/apod"
+API_TIMEOUT = 30
+CHUNK_DAYS = 30
+RANDOM_CHUNK = 50
+MAX_WORKERS = 4
+MAX_RETRIES = 2
+
+
+def fetch_api_range(api_key, start, end, client=None, timeout=API_TIMEOUT):
+    """Fetch the entries between start and end from the NASA APOD API."""
+    params = {
+        "api_key": api_key,
+        "start_date": date_str(start),
+        "end_date": date_str(end)
+    }
+    return _api_get(params, client, timeout)
+
+
+def fetch_api_random(api_key, count, client=None, timeout=API_TIMEOUT):
+    """Fetch `count` random entries from the NASA APOD API."""
+    params = {"api_key": api_key, "count": count}
+    return _api_get(params, client, timeout)
+
+
+def fetch_api_today(api_key, client=None, timeout=API_TIMEOUT):
+    """Fetch the entry NASA currently publishes as today's APOD."""
+    return _api_get({"api_key": api_key}, client, timeout)[0]
+
+
+def _api_get(params, client, timeout):
+    client = client or get_client()
+    response = client.get(APOD_API_URL, params=params, timeout=timeout)
+    if response.status_code != 200:
+        raise IOError("API error {}: {}".format(
+            response.status_code, response.text[:200]))
+    data = response.json()
+    if isinstance(data, dict):
+        data = [data]
+    return data
+
+
+def merge_entries(*groups):
+    """Merge entry lists, keeping one entry per date, sorted by date."""
+    merged = {}
+    for group in groups:
+        for entry in group or []:
+            if isinstance(entry, dict) and entry.get("date"):
+                merged[entry["date"]] = entry
+    return [merged[key] for key in sorted(merged)]
+
+
+class RangeFetcher:
+    """
+    Fetch APOD entries in parallel chunks with bounded concurrency.
+
+    on_chunk, when given, is called from the thread that runs the fetch
+    with (chunk, entries) as soon as each chunk succeeds. The worker
+    threads are kept for every fetch and retry until close().
+    """
+
+    def __init__(self, api_key, workers=MAX_WORKERS, chunk_days=CHUNK_DAYS,
+                 retries=MAX_RETRIES, timeout=API_TIMEOUT):
+        self.api_key = api_key
+        self.workers = max(1, workers)
+        self.chunk_days = chunk_days
+        self.retries = retries
+        self.timeout = timeout
+        self.client = get_client()
+        self._cancelled = threading.Event()
+        self._pool = ThreadPoolExecutor(max_workers=self.workers)
+
+    def cancel(self):
+        """Stop submitting new chunks; running requests finish normally."""
+        self._cancelled.set()
+
+    def close(self):
+        """
+        Stop the worker threads; connections belong to the shared client.
+        """
+        self._pool.shutdown()
+
+    def _fetch_range_chunk(self, chunk):
+        start, end = chunk
+        try:
+            return fetch_api_range(
+                self.api_key, start, end, self.client, self.timeout)
+        except Exception:
+            # The API rejects ranges ending on a day NASA has not published
+            # yet (local midnight comes before the US Eastern one)
+            if end >= date.today() and start < end:
+                return fetch_api_range(
+                    self.api_key, start, end - timedelta(days=1),
+                    self.client, self.timeout)
+            raise
+
+    def _fetch_random_chunk(self, chunk):
+        return fetch_api_random(
+            self.api_key, chunk, self.client, self.timeout)
+
+    def _run(self, chunks, worker, on_chunk):
+        """
+        Run worker over chunks on the pool, retrying only failed chunks.
+        Returns (entries, failed_chunks).
+        """
+        results = []
+        pending = list(chunks)
+        attempt = 0
+        while pending and attempt <= self.retries:
+            if attempt:
+                LOG.warning("Retrying %d failed chunk(s), attempt %d",
+                            len(pending), attempt)
+            failed = []
+            futures = {}
+            for chunk in pending:
+                if self._cancelled.is_set():
+                    break
+                futures[self._pool.submit(worker, chunk)] = chunk
+            for future in as_completed(futures):
+                chunk = futures[future]
+                try:
+                    entries = future.result()
+                except Exception as e:
+                    LOG.error("Chunk %s failed: %s", chunk, e)
+                    failed.append(chunk)
+                    continue
+                results.append(entries)
+                if on_chunk is not None:
+                    try:
+                        on_chunk(chunk, entries)
+                    except Exception as e:
+                        LOG.error("Chunk callback failed: %s", e)
+            if self._cancelled.is_set():
+                break
+            pending = failed
+            attempt += 1
+        return merge_entries(*results), pending
+
+    def fetch_range(self, start, end, on_chunk=None, ranges=None):
+        """
+        Fetch every entry between start and end, newest chunk first.
+        `ranges` restricts the fetch to the given (start, end) sub-ranges.
+        """
+        chunks = []
+        for range_start, range_end in ranges or [(start, end)]:
+            chunks.extend(
+                date_chunks(range_start, range_end, self.chunk_days))
+        chunks.sort(key=lambda chunk: chunk[1], reverse=True)
+        return self._run(chunks, self._fetch_range_chunk, on_chunk)
+
+    def fetch_random(self, count, on_chunk=None):
+        """Fetch about `count` random entries, de-duplicated by date."""
+        chunks = []
+        while count > 0:
+            chunks.append(min(count, RANDOM_CHUNK))
+            count -= RANDOM_CHUNK
+        return self._run(chunks, self._fetch_random_chunk, on_chunk)
+
+
+def sync_range(store, api_key, start, end, on_chunk=None, fetcher=None):
+    """
+    Bring the store up to date for the [start, end] window, asking the API
+    only for the dates that are not stored yet. Chunks are stored as soon
+    as they arrive; on_chunk(chunk, entries) is called after each one.
+    Returns the number of new entries; failed chunks are logged and leave
+    the stored data untouched.
+    """
+    ranges = store.missing_ranges(start, end)
+    if not ranges:
+        return 0
+    added = [0]
+
+    def store_chunk(chunk, entries):
+        added[0] += store.put_entries(entries)
+        if on_chunk is not None:
+            on_chunk(chunk, entries)
+
+    own_fetcher = fetcher is None
+    if own_fetcher:
+        fetcher = RangeFetcher(api_key)
+    try:
+        LOG.info("Syncing %d missing range(s) %s .. %s",
+                 len(ranges), ranges[0][0], ranges[-1][1])
+        _entries, failed = fetcher.fetch_range(
+            start, end, on_chunk=store_chunk, ranges=ranges)
+        for chunk in failed:
+            LOG.error("Sync of %s .. %s failed", chunk[0], chunk[1])
+    finally:
+        if own_fetcher:
+            fetcher.close()
+    return added[0]
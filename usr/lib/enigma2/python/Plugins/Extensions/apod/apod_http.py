@@ -0,0 +1,251 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""
+APOD - Astronomy Picture of the Day Plugin
+Shared HTTP client and conditional downloads
+
+All network access of the plugin goes through one HttpClient: a single
+requests.Session with per-host keep-alive pools, so the TLS handshake to
+each host happens once per session. The client applies the same default
+timeout, retry policy and url allow-list to every request.
+
+Every file downloaded through here gets a small JSON sidecar
+(<file>.meta) holding the ETag, Last-Modified and Content-Length the
+server sent. The next request for the same url carries If-None-Match /
+If-Modified-Since, and a 304 answer re-uses the local copy without
+transferring the body again.
+"""
+
+import hashlib
+import logging
+import threading
+from json import dumps, load
+from os import makedirs, remove, rename
+from os.path import exists, getsize, join
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from . import CACHE_DIR, HEADERS
+from .apod_cache import atomic_write, drop_temp, record, temp_file, touch
+
+LOG = logging.getLogger(__name__)
+
+META_SUFFIX = ".meta"
+PAGE_DIR = join(CACHE_DIR, "pages")
+DOWNLOAD_TIMEOUT = 30
+DOWNLOAD_CHUNK = 64 * 1024
+REQUEST_TIMEOUT = 15
+# hosts with their own keep-alive pool, and connections kept per host
+POOL_HOSTS = 10
+POOL_SIZE = 8
+RETRY_TOTAL = 2
+RETRY_BACKOFF = 0.5
+
+# Allow only NASA domains, the translator and known video/thumbnail CDNs
+ALLOWED_DOMAINS = (
+    'apod.nasa.gov',
+    'api.nasa.gov',
+    'www.nasa.gov',
+    'images-assets.nasa.gov',
+    'translate.googleapis.com',
+    'youtube.com',
+    'youtu.be',
+    'img.youtube.com',
+    'vimeo.com',
+    'vimeocdn.com'
+)
+
+
+class SecurityError(Exception):
+    """Exception raised for security-related errors"""
+    pass
+
+
+def validate_url(url):
+    """Validate URL to prevent SSRF attacks"""
+    try:
+        parsed = urlparse(url)
+        if parsed.scheme not in ('http', 'https'):
+            return False
+        domain = (parsed.hostname or '').lower()
+        if not any(
+                domain == allowed or domain.endswith('.' + allowed)
+                for allowed in ALLOWED_DOMAINS):
+            LOG.warning("Blocked unauthorized domain: %s", domain)
+            return False
+        return True
+    except Exception:
+        return False
+
+
+class HttpClient:
+    """
+    Pooled HTTP client shared by every network path of the plugin.
+    Thread safe: requests.Session may be used from worker threads as
+    long as its configuration is not changed.
+    """
+
+    def __init__(self, timeout=REQUEST_TIMEOUT):
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.verify = True
+        self.session.headers.update(HEADERS)
+        retry = Retry(
+            total=RETRY_TOTAL,
+            backoff_factor=RETRY_BACKOFF,
+            status_forcelist=(500, 502, 503, 504),
+            allowed_methods=frozenset(['GET', 'HEAD']),
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(
+            pool_connections=POOL_HOSTS,
+            pool_maxsize=POOL_SIZE,
+            max_retries=retry
+        )
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def get(self, url, **kwargs):
+        """session.get with the url allow-list and default timeout."""
+        if not validate_url(url):
+            raise SecurityError("Invalid URL: {}".format(url))
+        kwargs.setdefault('timeout', self.timeout)
+        return self.session.get(url, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Return the shared HttpClient, creating it on first use."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = HttpClient()
+        return _client
+
+
+def load_validators(path, url=None, check_size=True):
+    """
+    Return the stored validators of a cached file ({} if none). With
+    `url`, validators saved for a different url are ignored, so a fixed
+    path such as the splash image is never revalidated against yesterday's
+    image. check_size=False accepts a file shorter than the announced
+    length (a partial download about to be resumed).
+    """
+    meta_path = path + META_SUFFIX
+    if not exists(path) or not exists(meta_path):
+        return {}
+    try:
+        with open(meta_path, "r") as f:
+            meta = load(f)
+    except Exception as e:
+        LOG.debug("Unreadable validators %s: %s", meta_path, e)
+        return {}
+    if url is not None and meta.get("url") != url:
+        return {}
+    # a file that does not match the length the server announced is a
+    # leftover of an interrupted write: never revalidate it
+    length = meta.get("content_length")
+    if check_size and length is not None and getsize(path) != length:
+        LOG.warning("Cached file %s has the wrong size, refetching", path)
+        return {}
+    return meta
+
+
+def save_validators(path, url, headers):
+    """Store the validators from the response `headers` mapping."""
+    meta = {"url": url}
+    if headers.get("ETag"):
+        meta["etag"] = headers["ETag"]
+    if headers.get("Last-Modified"):
+        meta["last_modified"] = headers["Last-Modified"]
+    if headers.get("Content-Length") and not headers.get("Content-Encoding"):
+        try:
+            meta["content_length"] = int(headers["Content-Length"])
+        except ValueError:
+            pass
+    try:
+        atomic_write(path + META_SUFFIX, dumps(meta))
+    except Exception as e:
+        LOG.warning("Unable to save validators for %s: %s", path, e)
+
+
+def drop_validators(path):
+    if exists(path + META_SUFFIX):
+        try:
+            remove(path + META_SUFFIX)
+        except OSError:
+            pass
+
+
+def conditional_headers(path, url, headers=None):
+    """Request headers with the validators stored for `path` and `url`."""
+    request_headers = dict(HEADERS)
+    request_headers.update(headers or {})
+    meta = load_validators(path, url)
+    if meta.get("etag"):
+        request_headers["If-None-Match"] = meta["etag"]
+    if meta.get("last_modified"):
+        request_headers["If-Modified-Since"] = meta["last_modified"]
+    return request_headers
+
+
+def fetch_to_file(url, path, session=None, timeout=DOWNLOAD_TIMEOUT,
+                  headers=None):
+    """
+    Download `url` to `path`, revalidating an existing copy.
+    Returns (status_code, modified): modified is False when the server
+    answered 304 and the local copy was kept. Other errors raise.
+    """
+    getter = session.get if session is not None else get_client().get
+    request_headers = conditional_headers(path, url, headers)
+    with getter(url, headers=request_headers, stream=True,
+                timeout=timeout) as response:
+        if response.status_code == 304 and exists(path):
+            LOG.debug("Not modified: %s", url)
+            touch(path)
+            return 304, False
+        response.raise_for_status()
+        drop_validators(path)
+        tmp_path = temp_file(path)
+        try:
+            with open(tmp_path, "wb") as f:
+                for chunk in response.iter_content(DOWNLOAD_CHUNK):
+                    f.write(chunk)
+            rename(tmp_path, path)
+        except Exception:
+            drop_temp(tmp_path)
+            raise
+        save_validators(path, url, response.headers)
+        record(path)
+        return response.status_code, True
+
+
+def page_path(url):
+    if not exists(PAGE_DIR):
+        makedirs(PAGE_DIR)
+    return join(PAGE_DIR, hashlib.md5(url.encode("utf-8")).hexdigest())
+
+
+def fetch_text(url, session=None, timeout=DOWNLOAD_TIMEOUT,
+               encoding="latin1"):
+    """
+    Return (status_code, text) for a page, keeping a revalidated copy on
+    disk; a 304 answer is served from that copy with status 200.
+    """
+    path = page_path(url)
+    try:
+        status, _modified = fetch_to_file(url, path, session, timeout)
+    except requests.exceptions.HTTPError as e:
+        return e.response.status_code, ""
+    with open(path, "rb") as f:
+        return (200 if status == 304 else status), f.read().decode(
+            encoding, errors="replace")
@@ -0,0 +1,345 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""
+APOD - Astronomy Picture of the Day Plugin
+Image helpers: list thumbnails, display-size scaling and prefetch
+
+Thumbnails are downloaded from the low-res APOD url in the background,
+downscaled once with PIL to the list row size and kept in a cache folder
+named after the hash of the source url, so every url is fetched and
+scaled only once.
+
+Full images are decoded once at the size of the widget that shows them
+(JPEG draft mode lets libjpeg skip most of the pixels) and the result is
+kept next to the original, so the Pixmap never decodes a multi-megapixel
+file on the box.
+
+While the archive list is browsed, the images of the selected entry and
+its neighbours are downloaded and pre-scaled by a single low priority
+worker, so opening the detail screen finds them already local.
+"""
+
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from os import makedirs, rename
+from os.path import exists, getmtime, join, splitext
+
+from twisted.internet import reactor
+
+from .apod_cache import drop_temp, record, temp_file, touch
+from .apod_http import get_client
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+LOG = logging.getLogger(__name__)
+
+THUMB_TIMEOUT = 15
+THUMB_WORKERS = 2
+PREFETCH_TIMEOUT = 30
+DOWNLOAD_CHUNK = 64 * 1024
+
+
+class MemoryLRU:
+    """
+    Least recently used cache bounded by the total size of its values,
+    as reported by the caller on put().
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.size = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return default
+            self._items.move_to_end(key)
+            return item[0]
+
+    def put(self, key, value, size=1):
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.size -= old[1]
+            if size > self.max_size:
+                return
+            self._items[key] = (value, size)
+            self.size += size
+            while self.size > self.max_size:
+                _key, (_value, old_size) = self._items.popitem(last=False)
+                self.size -= old_size
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._items
+
+    def __len__(self):
+        return len(self._items)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.size = 0
+
+
+def image_url(entry):
+    """The url the detail screen shows for an image entry."""
+    return entry.get("hdurl") or entry.get("url") or None
+
+
+def scaled_path(path, size):
+    """Path of the display-size copy of `path` for a widget of `size`."""
+    return "{}_{}x{}.jpg".format(splitext(path)[0], size[0], size[1])
+
+
+def scale_image(path, size):
+    """
+    Return a copy of the image at `path` fitted inside `size`, building it
+    on first use. Animated GIFs, images that already fit and any decode
+    failure fall back to the original path. Blocking: call it from a
+    worker thread.
+    """
+    if Image is None or not size or not exists(path):
+        return path
+    target = scaled_path(path, size)
+    if exists(target) and getmtime(target) >= getmtime(path):
+        touch(target)
+        return target
+    tmp_path = None
+    try:
+        image = Image.open(path)
+        if getattr(image, "is_animated", False):
+            return path
+        if image.size[0] <= size[0] and image.size[1] <= size[1]:
+            return path
+        image.draft("RGB", size)
+        image = image.convert("RGB")
+        image.thumbnail(size, Image.LANCZOS)
+        # the screens and the prefetchers may scale one image at once
+        tmp_path = temp_file(target)
+        image.save(tmp_path, "JPEG", quality=90)
+        rename(tmp_path, target)
+        record(target)
+        LOG.debug("Scaled %s to %s", path, image.size)
+        return target
+    except Exception as e:
+        LOG.warning("Scaling failed for %s: %s", path, e)
+        if tmp_path is not None:
+            drop_temp(tmp_path)
+        return path
+
+
+def url_key(url):
+    """Stable cache key for a url."""
+    return hashlib.md5(url.encode("utf-8")).hexdigest()
+
+
+def thumb_path(cache_dir, url, size):
+    """Path of the list thumbnail built from `url` for rows of `size`."""
+    return join(cache_dir, "thumbs", "{}_{}x{}.png".format(
+        url_key(url), size[0], size[1]))
+
+
+def thumb_source(entry):
+    """Return the url to build the list thumbnail from, or None."""
+    if entry.get("media_type") == "video":
+        return entry.get("thumbnail_url") or None
+    return entry.get("url") or None
+
+
+class ThumbnailLoader:
+    """
+    Background thumbnail builder.
+
+    request(url, callback) schedules a thumbnail and calls
+    callback(url, path) on the reactor thread once it is ready;
+    keep(urls) drops every queued request not in `urls`, so only the rows
+    around the list cursor are ever downloaded.
+    """
+
+    def __init__(self, cache_dir, size, workers=THUMB_WORKERS):
+        self.cache_dir = cache_dir
+        self.folder = join(cache_dir, "thumbs")
+        if not exists(self.folder):
+            makedirs(self.folder)
+        self.size = size
+        self._pool = ThreadPoolExecutor(max_workers=workers)
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._closed = False
+
+    @property
+    def available(self):
+        return Image is not None
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def path_for(self, url):
+        return thumb_path(self.cache_dir, url, self.size)
+
+    def cached(self, url):
+        """Return the thumbnail path if it is already built, else None."""
+        path = self.path_for(url)
+        if exists(path):
+            touch(path)
+            return path
+        return None
+
+    def request(self, url, callback):
+        if not url or not self.available or self._closed:
+            return
+        path = self.cached(url)
+        if path:
+            callback(url, path)
+            return
+        with self._lock:
+            if url in self._pending:
+                return
+            self._pending[url] = self._pool.submit(
+                self._build, url, callback)
+
+    def keep(self, urls):
+        """Cancel queued requests for urls outside the visible window."""
+        urls = set(urls)
+        with self._lock:
+            for url, future in list(self._pending.items()):
+                if url not in urls and future.cancel():
+                    del self._pending[url]
+
+    def close(self):
+        self._closed = True
+        with self._lock:
+            for future in self._pending.values():
+                future.cancel()
+            self._pending.clear()
+        self._pool.shutdown(wait=False)
+
+    def _build(self, url, callback):
+        path = self.path_for(url)
+        tmp_path = None
+        try:
+            response = get_client().get(url, timeout=THUMB_TIMEOUT)
+            response.raise_for_status()
+            image = Image.open(BytesIO(response.content))
+            # let the JPEG decoder skip most of the pixels
+            image.draft("RGB", self.size)
+            image = image.convert("RGB")
+            image.thumbnail(self.size, Image.LANCZOS)
+            # other loaders (the daily prefetch) may build it meanwhile
+            tmp_path = temp_file(path)
+            image.save(tmp_path, "PNG")
+            # rename is atomic: a reader never sees half a thumbnail
+            rename(tmp_path, path)
+            record(path)
+        except Exception as e:
+            LOG.warning("Thumbnail failed for %s: %s", url, e)
+            if tmp_path is not None:
+                drop_temp(tmp_path)
+            return
+        finally:
+            with self._lock:
+                self._pending.pop(url, None)
+        if not self._closed:
+            reactor.callFromThread(callback, url, path)
+
+
+class ImagePrefetcher:
+    """
+    Download and pre-scale the images of the entries around the list
+    cursor on one background worker.
+
+    schedule(entries) replaces the wanted set: queued jobs for other
+    entries are cancelled and a running download for an entry that is no
+    longer wanted stops at its next chunk.
+    """
+
+    def __init__(self, blobs, size):
+        self.blobs = blobs
+        self.size = size
+        self._pool = ThreadPoolExecutor(max_workers=1)
+        self._lock = threading.Lock()
+        self._jobs = {}
+        # what the last schedule() asked for; running jobs cannot be
+        # cancelled, so their downloads check this instead of _jobs
+        self._wanted = set()
+        self._closed = False
+
+    def schedule(self, entries):
+        wanted = {}
+        for entry in entries:
+            url = image_url(entry)
+            if entry.get("media_type", "image") != "image" or not url:
+                continue
+            if url.lower().endswith(".gif") or not entry.get("date"):
+                continue
+            wanted[url] = entry["date"]
+        with self._lock:
+            if self._closed:
+                return
+            self._wanted = set(wanted)
+            for url, future in list(self._jobs.items()):
+                if url not in wanted and future.cancel():
+                    del self._jobs[url]
+            # entries come nearest first and the pool runs them in order
+            for url, day in wanted.items():
+                if url not in self._jobs:
+                    self._jobs[url] = self._pool.submit(self._run, url, day)
+
+    def wanted(self, url):
+        with self._lock:
+            return not self._closed and url in self._wanted
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            self._wanted.clear()
+            for future in self._jobs.values():
+                future.cancel()
+            self._jobs.clear()
+        self._pool.shutdown(wait=False)
+
+    def _run(self, url, day):
+        try:
+            path = self.blobs.lookup(url)
+            if path is None:
+                # not fetch()'s staging file: that one may be downloading
+                staging = self.blobs.staging_path(url, "-prefetch")
+                self._download(url, staging)
+                path = self.blobs.commit(url, staging, day)
+            scale_image(path, self.size)
+        except Exception as e:
+            LOG.warning("Prefetch failed for %s: %s", url, e)
+        finally:
+            with self._lock:
+                self._jobs.pop(url, None)
+
+    def _download(self, url, path):
+        tmp_path = temp_file(path)
+        try:
+            with get_client().get(url, stream=True,
+                                  timeout=PREFETCH_TIMEOUT) as response:
+                response.raise_for_status()
+                with open(tmp_path, "wb") as f:
+                    for chunk in response.iter_content(DOWNLOAD_CHUNK):
+                        if not self.wanted(url):
+                            LOG.debug("Prefetch of %s cancelled", url)
+                            raise IOError("cancelled")
+                        f.write(chunk)
+            rename(tmp_path, path)
+            LOG.debug("Prefetched %s", url)
+            return True
+        except Exception:
+            drop_temp(tmp_path)
+            raise
@@ -0,0 +1,199 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""
+APOD - Astronomy Picture of the Day Plugin
+Persistent metadata store
+
+Every APOD entry ever seen is kept in a small SQLite database under
+SYSTEM_DIR, keyed by its date. Opening the archive reads from the store and
+only the dates that are not stored yet are requested from the NASA API
+(see apod_fetcher).
+"""
+
+import logging
+import sqlite3
+import threading
+import time
+from datetime import date, datetime, timedelta
+from json import dumps, loads
+from os import makedirs
+from os.path import dirname, exists, join
+
+from . import SYSTEM_DIR
+
+LOG = logging.getLogger(__name__)
+
+STORE_FILE = join(SYSTEM_DIR, "apod_store.db")
+DATE_FORMAT = "%Y-%m-%d"
+# English month names of the scraped page dates ("2026 April 18"), not
+# strptime's %B which follows the receiver locale
+MONTHS = ("january", "february", "march", "april", "may", "june", "july",
+          "august", "september", "october", "november", "december")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS apod (
+    date TEXT PRIMARY KEY,
+    media_type TEXT,
+    title TEXT,
+    data TEXT NOT NULL,
+    updated REAL NOT NULL
+)
+"""
+
+
+def to_date(value):
+    """
+    Return a datetime.date for a date object, a 'YYYY-MM-DD' string or a
+    page date like '2026 April 18'.
+    """
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    try:
+        return datetime.strptime(value, DATE_FORMAT).date()
+    except ValueError:
+        parts = value.split()
+        if len(parts) != 3 or parts[1].lower() not in MONTHS:
+            raise
+        return date(int(parts[0]), MONTHS.index(parts[1].lower()) + 1,
+                    int(parts[2]))
+
+
+def date_str(value):
+    return to_date(value).strftime(DATE_FORMAT)
+
+
+def date_chunks(start, end, days=30, newest_first=True):
+    """Split the [start, end] window into (start, end) chunks of `days`."""
+    start, end = to_date(start), to_date(end)
+    step = timedelta(days=days)
+    one_day = timedelta(days=1)
+    chunks = []
+    if newest_first:
+        chunk_end = end
+        while chunk_end >= start:
+            chunk_start = max(start, chunk_end - step + one_day)
+            chunks.append((chunk_start, chunk_end))
+            chunk_end = chunk_start - one_day
+    else:
+        chunk_start = start
+        while chunk_start <= end:
+            chunk_end = min(end, chunk_start + step - one_day)
+            chunks.append((chunk_start, chunk_end))
+            chunk_start = chunk_end + one_day
+    return chunks
+
+
+class ApodStore:
+    """SQLite backed store of APOD entries keyed by date."""
+
+    def __init__(self, path=STORE_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        folder = dirname(path)
+        if folder and not exists(folder):
+            makedirs(folder)
+        # Used from the reactor thread and from deferToThread workers,
+        # access is serialized by self._lock
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute(_SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def put_entries(self, entries):
+        """Insert or replace entries; returns the number stored."""
+        rows = []
+        now = time.time()
+        for entry in entries or []:
+            if not isinstance(entry, dict) or not entry.get("date"):
+                continue
+            try:
+                key = date_str(entry["date"])
+            except ValueError:
+                LOG.warning("Skipping entry with bad date: %s", entry["date"])
+                continue
+            rows.append((
+                key,
+                entry.get("media_type", ""),
+                entry.get("title", ""),
+                dumps(entry, ensure_ascii=False),
+                now
+            ))
+        if rows:
+            with self._lock, self._conn:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO apod VALUES (?, ?, ?, ?, ?)",
+                    rows)
+        return len(rows)
+
+    def get(self, day):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM apod WHERE date = ?",
+                (date_str(day),)).fetchone()
+        return loads(row[0]) if row else None
+
+    def get_range(self, start, end):
+        """Return stored entries between start and end (inclusive)."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT data FROM apod WHERE date BETWEEN ? AND ? "
+                "ORDER BY date",
+                (date_str(start), date_str(end))).fetchall()
+        return [loads(row[0]) for row in rows]
+
+    def stored_dates(self, start, end):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT date FROM apod WHERE date BETWEEN ? AND ?",
+                (date_str(start), date_str(end))).fetchall()
+        return set(row[0] for row in rows)
+
+    def newest_date(self):
+        with self._lock:
+            row = self._conn.execute("SELECT MAX(date) FROM apod").fetchone()
+        return to_date(row[0]) if row and row[0] else None
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM apod").fetchone()[0]
+
+    def missing_ranges(self, start, end):
+        """
+        Return the (start, end) date ranges inside the window that have no
+        stored entry, merged into as few contiguous ranges as possible.
+        """
+        start, end = to_date(start), to_date(end)
+        stored = self.stored_dates(start, end)
+        ranges = []
+        run_start = None
+        day = start
+        one_day = timedelta(days=1)
+        while day <= end:
+            if day.strftime(DATE_FORMAT) in stored:
+                if run_start is not None:
+                    ranges.append((run_start, day - one_day))
+                    run_start = None
+            elif run_start is None:
+                run_start = day
+            day += one_day
+        if run_start is not None:
+            ranges.append((run_start, end))
+        return ranges
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """Return the shared ApodStore instance, opening it on first use."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ApodStore()
+        return _store
@@ -0,0 +1,175 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""
+APOD - Astronomy Picture of the Day Plugin
+Video thumbnail resolver
+
+YouTube thumbnails follow from the video id; Vimeo ones need a call to
+the Vimeo API. Lookups run on a small thread pool and resolve() returns a
+concurrent.futures.Future, so nobody waits on a third party API unless
+it asks for the result. Every id is looked up once: results are kept in
+memory and Vimeo ones in a JSON file under SYSTEM_DIR, and concurrent
+requests for the same video share one lookup.
+"""
+
+import logging
+import re
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from json import dumps, loads
+from os.path import exists, join
+
+from . import SYSTEM_DIR
+from .apod_cache import atomic_write
+from .apod_http import get_client
+
+LOG = logging.getLogger(__name__)
+
+THUMBS_FILE = join(SYSTEM_DIR, "video_thumbs.json")
+VIMEO_API = "https://vimeo.com/api/v2/video/{}.json"
+YOUTUBE_THUMB = "https://img.youtube.com/vi/{}/0.jpg"
+LOOKUP_WORKERS = 4
+LOOKUP_TIMEOUT = 15
+
+YOUTUBE_ID = re.compile(r"(?:youtu\.be/|/embed/|/v/|[?&]v=)([\w-]+)")
+VIMEO_ID = re.compile(r"(?:/video/|vimeo\.com/)(\d+)")
+
+
+def video_key(url):
+    """'youtube:<id>' or 'vimeo:<id>' for a video url, else None."""
+    if not url:
+        return None
+    if "youtube" in url or "youtu.be" in url:
+        match = YOUTUBE_ID.search(url)
+        return "youtube:" + match.group(1) if match else None
+    if "vimeo" in url:
+        match = VIMEO_ID.search(url)
+        return "vimeo:" + match.group(1) if match else None
+    return None
+
+
+def _done(value):
+    future = Future()
+    future.set_result(value)
+    return future
+
+
+class VideoThumbResolver:
+    """Thread safe, memoized video url -> thumbnail url lookups."""
+
+    def __init__(self, path=THUMBS_FILE, workers=LOOKUP_WORKERS):
+        self.path = path
+        self._lock = threading.Lock()
+        # one writer at a time: a snapshot never overwrites a newer one
+        self._save_lock = threading.Lock()
+        self._dirty = False
+        self._known = {}
+        self._pending = {}
+        self._pool = ThreadPoolExecutor(max_workers=workers)
+        self.load()
+
+    def load(self):
+        if not exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                self._known.update(loads(f.read()))
+        except Exception as e:
+            LOG.warning("Ignoring %s: %s", self.path, e)
+
+    def save(self):
+        """Write the Vimeo lookups if any changed since the last save."""
+        with self._save_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                self._dirty = False
+                data = dumps(dict(
+                    (key, thumb) for key, thumb in self._known.items()
+                    if key.startswith("vimeo:")))
+            try:
+                atomic_write(self.path, data)
+            except Exception as e:
+                LOG.error("Unable to save %s: %s", self.path, e)
+                with self._lock:
+                    self._dirty = True
+
+    def cached(self, url):
+        """Thumbnail url when known without a lookup ("" if none), else None."""
+        key = video_key(url)
+        if key is None:
+            return ""
+        if key.startswith("youtube:"):
+            return YOUTUBE_THUMB.format(key[8:])
+        with self._lock:
+            return self._known.get(key)
+
+    def resolve(self, url):
+        """Future of the thumbnail url of a video ("" when there is none)."""
+        key = video_key(url)
+        if key is None or key.startswith("youtube:"):
+            return _done(self.cached(url))
+        # the memo and the pending lookups are checked together: a lookup
+        # moves its key from one to the other under this same lock
+        with self._lock:
+            thumb = self._known.get(key)
+            if thumb is not None:
+                return _done(thumb)
+            future = self._pending.get(key)
+            if future is None:
+                future = self._pool.submit(self._lookup, key)
+                self._pending[key] = future
+        return future
+
+    def resolve_many(self, urls, timeout=LOOKUP_TIMEOUT):
+        """{url: thumbnail url} for many videos, looked up in parallel."""
+        futures = dict((url, self.resolve(url)) for url in set(urls))
+        results = {}
+        for url, future in futures.items():
+            try:
+                results[url] = future.result(timeout)
+            except Exception:
+                results[url] = ""
+        return results
+
+    def _lookup(self, key):
+        video_id = key.split(":", 1)[1]
+        thumb = ""
+        known = True
+        try:
+            response = get_client().get(
+                VIMEO_API.format(video_id), timeout=LOOKUP_TIMEOUT)
+            if response.status_code == 200:
+                thumb = loads(response.content.decode("utf-8"))[0].get(
+                    "thumbnail_large", "")
+            elif response.status_code != 404:
+                # try again next time
+                known = False
+        except Exception as e:
+            LOG.warning("Vimeo lookup of %s failed: %s", video_id, e)
+            known = False
+        with self._lock:
+            self._pending.pop(key, None)
+            if known:
+                self._known[key] = thumb
+                self._dirty = True
+        if known:
+            # lookups finishing together share one write
+            self.save()
+        return thumb
+
+    def close(self):
+        self._pool.shutdown(wait=False)
+
+
+_resolver = None
+_resolver_lock = threading.Lock()
+
+
+def get_resolver():
+    """Return the shared VideoThumbResolver, creating it on first use."""
+    global _resolver
+    with _resolver_lock:
+        if _resolver is None:
+            _resolver = VideoThumbResolver()
+        return _resolver
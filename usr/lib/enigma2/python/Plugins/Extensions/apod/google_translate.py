@@ -5,19 +5,20 @@
 
 import hashlib
 import json
-import socket
+import re
+import threading
 import time
-from json import JSONDecodeError, loads
+from json import JSONDecodeError
 from os import makedirs, remove
 from os.path import dirname, exists, join
 
-from urllib.error import HTTPError, URLError
-from urllib.parse import urlencode
-from urllib.request import Request, urlopen
+from requests.exceptions import RequestException, Timeout
 
 from Components.config import config
 
-from . import HEADERS, SYSTEM_DIR
+from . import SYSTEM_DIR
+from .apod_cache import atomic_write
+from .apod_http import get_client
 DEBUG = True
 # ============================================================
 # CUSTOM CONFIGURATION
@@ -32,12 +33,21 @@ REQUEST_TIMEOUT = 8
 # Character limit for batch translation (to avoid errors)
 MAX_CHARS_PER_REQUEST = 2000
 
+# Batch texts travel one per line: Google keeps the line breaks of the
+# source, while inline markers get translated, moved or dropped
+BATCH_SEPARATOR = "\n"
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
 # Local cache to avoid repetitive requests
 CACHE_FILE = join(SYSTEM_DIR, "translation_cache.json")
 _translation_cache = {}
 _cache_hits = 0
 _cache_misses = 0
 _cache_dirty = False    # flag to know if there are changes to save
+# translations run on worker threads: the cache and counters above are
+# only touched under _cache_lock, and one save writes at a time
+_cache_lock = threading.Lock()
+_save_lock = threading.Lock()
 
 # Enable logging
 ENABLE_LOGGING = True
@@ -62,31 +72,39 @@ def load_cache_from_disk():
     """Load the cache from the JSON file at startup."""
     global _translation_cache
     _ensure_cache_dir()
+    loaded = {}
     if exists(CACHE_FILE):
         try:
             with open(CACHE_FILE, 'r', encoding='utf-8') as f:
-                _translation_cache = json.load(f)
-            _log(f"Cache loaded from disk ({len(_translation_cache)} entries)")
+                loaded = json.load(f)
+            _log(f"Cache loaded from disk ({len(loaded)} entries)")
         except Exception as e:
             _log(f"Error loading cache: {e}")
-            _translation_cache = {}
-    else:
-        _translation_cache = {}
+            loaded = {}
+    with _cache_lock:
+        _translation_cache = loaded
 
 
 def save_cache_to_disk():
     """Save the cache to disk if there are changes."""
     global _cache_dirty
-    if not _cache_dirty:
-        return
-    _ensure_cache_dir()
-    try:
-        with open(CACHE_FILE, 'w', encoding='utf-8') as f:
-            json.dump(_translation_cache, f, ensure_ascii=False, indent=2)
-        _log(f"Cache saved to disk ({len(_translation_cache)} entries)")
-        _cache_dirty = False
-    except Exception as e:
-        _log(f"Error saving cache: {e}")
+    with _save_lock:
+        with _cache_lock:
+            if not _cache_dirty:
+                return
+            # dumped from a copy: other threads keep adding meanwhile
+            snapshot = dict(_translation_cache)
+            _cache_dirty = False
+        _ensure_cache_dir()
+        try:
+            atomic_write(CACHE_FILE, json.dumps(
+                snapshot, ensure_ascii=False, indent=2),
+                encoding='utf-8')
+            _log(f"Cache saved to disk ({len(snapshot)} entries)")
+        except Exception as e:
+            _log(f"Error saving cache: {e}")
+            with _cache_lock:
+                _cache_dirty = True
 
 
 # ============================================================
@@ -204,13 +222,15 @@ def _get_cache_key(text, target_lang):
     return hashlib.md5(key_string).hexdigest()
 
 
-def _cache_translation(text, target_lang, translated):
+def _cache_translation(text, target_lang, translated, save=True):
     """Store a translation in the cache and save immediately to disk."""
     global _cache_dirty
     cache_key = _get_cache_key(text, target_lang)
-    _translation_cache[cache_key] = translated
-    _cache_dirty = True
-    save_cache_to_disk()
+    with _cache_lock:
+        _translation_cache[cache_key] = translated
+        _cache_dirty = True
+    if save:
+        save_cache_to_disk()
     return translated
 
 
@@ -219,36 +239,41 @@ def _get_cached_translation(text, target_lang):
     global _cache_hits, _cache_misses
     cache_key = _get_cache_key(text, target_lang)
 
-    if cache_key in _translation_cache:
-        _cache_hits += 1
-        return _translation_cache[cache_key]
+    with _cache_lock:
+        if cache_key in _translation_cache:
+            _cache_hits += 1
+            return _translation_cache[cache_key]
 
-    _cache_misses += 1
-    return None
+        _cache_misses += 1
+        return None
 
 
 def get_cache_stats():
     """Return cache statistics"""
-    return {
-        'hits': _cache_hits,
-        'misses': _cache_misses,
-        'size': len(_translation_cache),
-        'hit_rate': _cache_hits / max(1, _cache_hits + _cache_misses)
-    }
+    with _cache_lock:
+        return {
+            'hits': _cache_hits,
+            'misses': _cache_misses,
+            'size': len(_translation_cache),
+            'hit_rate': _cache_hits / max(1, _cache_hits + _cache_misses)
+        }
 
 
 def clear_cache():
     """Clear the translation cache and delete the file"""
     global _cache_hits, _cache_misses, _cache_dirty
-    _translation_cache.clear()
-    _cache_hits = 0
-    _cache_misses = 0
-    _cache_dirty = False
-    if exists(CACHE_FILE):
-        try:
-            remove(CACHE_FILE)
-        except Exception as e:
-            _log(f"Error deleting cache file: {e}")
+    # no save in progress may write the file back
+    with _save_lock:
+        with _cache_lock:
+            _translation_cache.clear()
+            _cache_hits = 0
+            _cache_misses = 0
+            _cache_dirty = False
+        if exists(CACHE_FILE):
+            try:
+                remove(CACHE_FILE)
+            except Exception as e:
+                _log(f"Error deleting cache file: {e}")
     _log("Cache cleared")
 
 
@@ -256,6 +281,36 @@ def clear_cache():
 # MAIN TRANSLATION FUNCTION
 # ============================================================
 
+def _request_translation(text, target_lang):
+    """
+    One call to the translation API. Returns the raw translated text,
+    line breaks included; raises on HTTP and decoding errors.
+    """
+    params = {
+        "client": "gtx",           # Fake client to bypass restrictions
+        "sl": "auto",              # Automatic source language
+        "tl": target_lang,         # Target language
+        "dt": "t",                 # Response type: translation only
+        "q": text,                 # Text to translate
+    }
+    # Perform the request on the shared keep-alive connection pool
+    response = get_client().get(
+        TRANSLATE_API_URL, params=params, timeout=REQUEST_TIMEOUT)
+    response.raise_for_status()
+
+    # Parse JSON response
+    data = json.loads(response.content.decode('utf-8'))
+
+    # Extract the translation from the JSON structure
+    translated_text = ""
+    if isinstance(data, list) and data and isinstance(data[0], list):
+        # Typical structure: [[[translation, original], ...], ...]
+        for item in data[0]:
+            if item and isinstance(item, list) and item[0]:
+                translated_text += item[0]
+    return translated_text
+
+
 def translate_text(text, target_lang=None, use_cache=True):
     """
     Translates text using the Google Translate API.
@@ -297,56 +352,14 @@ def translate_text(text, target_lang=None, use_cache=True):
             _log(f"Cache HIT: '{text_unicode[:30]}...' -> '{cached[:30]}...'")
             return cached
 
-    # Error handling for overly long texts
+    # Overly long texts go by sentences through the batch engine
     if len(text_unicode) > MAX_CHARS_PER_REQUEST:
-        current_len = len(text_unicode)
-        _log(
-            "Text too long (%d chars), truncated to %d",
-            current_len,
-            MAX_CHARS_PER_REQUEST,
-        )
-        text_unicode = text_unicode[:MAX_CHARS_PER_REQUEST]
-
-    # Prepare the request
-    params = {
-        "client": "gtx",           # Fake client to bypass restrictions
-        "sl": "auto",              # Automatic source language
-        "tl": target_lang,         # Target language
-        "dt": "t",                 # Response type: translation only
-        "q": text_unicode,         # Text to translate
-    }
+        _log(f"Text too long ({len(text_unicode)} chars), split in sentences")
+        return translate_batch([text_unicode], target_lang, use_cache)[0]
 
     try:
-        # Build the URL
-        query_string = urlencode(params)
-        url = f"{TRANSLATE_API_URL}?{query_string}"
-
         _log(f"Translating: '{text_unicode[:40]}...' -> {target_lang}")
-
-        # Set timeout to avoid blocking
-        socket.setdefaulttimeout(REQUEST_TIMEOUT)
-
-        # Perform the request
-        req = Request(url)
-        for key, value in HEADERS.items():
-            req.add_header(key, value)
-        response = urlopen(req, timeout=REQUEST_TIMEOUT)
-        raw_data = response.read()
-
-        # Decode the response
-        if isinstance(raw_data, bytes):
-            raw_data = raw_data.decode('utf-8')
-
-        # Parse JSON response
-        data = loads(raw_data)
-
-        # Extract the translation from the JSON structure
-        translated_text = ""
-        if isinstance(data, list) and data:
-            # Typical structure: [[[translation, original], ...], ...]
-            for item in data[0]:
-                if item and isinstance(item, list) and item[0]:
-                    translated_text += item[0]
+        translated_text = _request_translation(text_unicode, target_lang)
 
         # Clean the result
         if translated_text:
@@ -365,12 +378,13 @@ def translate_text(text, target_lang=None, use_cache=True):
             _log(f"Empty API response for: '{text_unicode[:30]}...'")
             return text_unicode
 
-    except socket.timeout:
+    except Timeout:
         _log(f"TIMEOUT during translation: '{text_unicode[:30]}...'")
         return text_unicode
 
-    except (URLError, HTTPError) as e:
-        _log(f"HTTP error {getattr(e, 'code', 'N/A')}: {str(e)}")
+    except RequestException as e:
+        status = getattr(getattr(e, 'response', None), 'status_code', 'N/A')
+        _log(f"HTTP error {status}: {str(e)}")
         return text_unicode
 
     except JSONDecodeError as e:
@@ -382,20 +396,101 @@ def translate_text(text, target_lang=None, use_cache=True):
         _log(f"Error {error_type}: {str(e)}")
         return text_unicode
 
-    finally:
-        # Restore default timeout
-        socket.setdefaulttimeout(None)
-
 
 # ============================================================
 # AUXILIARY FUNCTIONS FOR SPECIAL CASES
 # ============================================================
 
 
+def _split_sentences(text, limit=MAX_CHARS_PER_REQUEST):
+    """Cut a text into pieces of at most `limit` chars between sentences."""
+    pieces = []
+    current = ""
+    for sentence in SENTENCE_END.split(text):
+        while len(sentence) > limit:
+            # a sentence longer than a request: cut it between words
+            cut = sentence.rfind(" ", 0, limit)
+            if cut <= 0:
+                cut = limit
+            if current:
+                pieces.append(current)
+                current = ""
+            pieces.append(sentence[:cut])
+            sentence = sentence[cut:].lstrip()
+        if current and len(current) + 1 + len(sentence) > limit:
+            pieces.append(current)
+            current = ""
+        current = f"{current} {sentence}" if current else sentence
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def _pack(pieces, limit=MAX_CHARS_PER_REQUEST):
+    """Group piece indices into requests of at most `limit` chars."""
+    packs = []
+    pack = []
+    size = 0
+    for index, piece in enumerate(pieces):
+        extra = len(piece) + (len(BATCH_SEPARATOR) if pack else 0)
+        if pack and size + extra > limit:
+            packs.append(pack)
+            pack = []
+            extra = len(piece)
+            size = 0
+        pack.append(index)
+        size += extra
+    if pack:
+        packs.append(pack)
+    return packs
+
+
+def _translate_pack(pieces, target_lang):
+    """Translated pieces of one request, None when the parts do not match."""
+    translated = _request_translation(
+        BATCH_SEPARATOR.join(pieces), target_lang)
+    parts = [_clean_whitespace(part)
+             for part in translated.strip().split(BATCH_SEPARATOR)]
+    if len(parts) != len(pieces) or not all(parts):
+        return None
+    return parts
+
+
+def _translate_pieces(pieces, target_lang):
+    """
+    Translate pieces packed into as few requests as possible. A request
+    whose answer does not split back into its parts is halved and sent
+    again; the other requests are kept. None marks the pieces left
+    untranslated after a network error.
+    """
+    results = [None] * len(pieces)
+    queue = _pack(pieces)
+    while queue:
+        pack = queue.pop(0)
+        try:
+            parts = _translate_pack([pieces[i] for i in pack], target_lang)
+        except Exception as e:
+            # the service is unreachable: do not hammer it
+            _log(f"Batch translation error: {type(e).__name__}: {e}")
+            break
+        if parts is not None:
+            for index, part in zip(pack, parts):
+                results[index] = part
+        elif len(pack) > 1:
+            _log(f"Batch of {len(pack)} parts did not split back, halving")
+            half = len(pack) // 2
+            queue[:0] = [pack[:half], pack[half:]]
+        else:
+            _log(f"No translation for: '{pieces[pack[0]][:30]}...'")
+    return results
+
+
 def translate_batch(texts, target_lang=None, use_cache=True):
     """
     Translates a list of texts in batch.
-    Optimized to reduce the number of HTTP requests.
+    Texts are cut between sentences and packed into requests of up to
+    MAX_CHARS_PER_REQUEST chars, so a list of titles takes one or two
+    requests.
 
     Args:
         texts (list): List of texts to translate
@@ -403,7 +498,7 @@ def translate_batch(texts, target_lang=None, use_cache=True):
         use_cache (bool): Use cache
 
     Returns:
-        list: List of translated texts
+        list: List of translated texts, the original for failed ones
     """
     if not texts:
         return []
@@ -411,73 +506,52 @@ def translate_batch(texts, target_lang=None, use_cache=True):
     # Use system language if not specified
     if target_lang is None:
         target_lang = _get_system_language()
-    results = []
-    batch_text = []
-    batch_indices = []
+    target_lang = target_lang.lower()
+    results = [_to_unicode(text) for text in texts]
+    wanted = {}
 
-    for i, text in enumerate(texts):
-        text_unicode = _to_unicode(text)
+    for i, text_unicode in enumerate(results):
+        if not text_unicode.strip() or _is_text_arabic(text_unicode):
+            continue
 
         # Check cache
         if use_cache:
             cached = _get_cached_translation(text_unicode, target_lang)
             if cached is not None:
-                results.append(cached)
+                results[i] = cached
                 continue
 
-        # If the text is Arabic, do not translate it
-        if _is_text_arabic(text_unicode):
-            results.append(text_unicode)
+        # same text, one translation
+        wanted.setdefault(text_unicode, []).append(i)
+
+    if not wanted:
+        return results
+
+    # one line per piece: line breaks inside a text would add parts
+    sources = list(wanted)
+    pieces = []
+    owners = []
+    for n, text_unicode in enumerate(sources):
+        for piece in _split_sentences(" ".join(text_unicode.split())):
+            pieces.append(piece)
+            owners.append(n)
+    translated = _translate_pieces(pieces, target_lang)
+
+    done = {}
+    for n, part in zip(owners, translated):
+        done.setdefault(n, []).append(part)
+    for n, text_unicode in enumerate(sources):
+        parts = done.get(n, [])
+        if not parts or None in parts:
             continue
-
-        # Add to batch
-        batch_text.append(text_unicode)
-        batch_indices.append(i)
-        results.append(None)  # Placeholder
-
-    # If there are texts to translate in batch
-    if batch_text:
-        try:
-            # Join texts with a special separator
-            separator = u" ||| "
-            combined_text = separator.join(batch_text)
-
-            # Translate the batch
-            combined_translated = translate_text(
-                combined_text,
-                target_lang,
-                use_cache=False  # Do not use cache for batch
-            )
-
-            # Split results
-            if separator in combined_translated:
-                translated_parts = combined_translated.split(separator)
-            else:
-                # Fallback: split by approximate number
-                translated_parts = [combined_translated] * len(batch_text)
-
-            # Update results
-            for idx, translated in zip(batch_indices, translated_parts):
-                results[idx] = translated
-
-                # Save to cache
-                if use_cache and idx < len(texts):
-                    text_unicode = _to_unicode(texts[idx])
-                    _cache_translation(text_unicode, target_lang, translated)
-
-        except Exception as e:
-            _log(f"Batch translation error: {str(e)}")
-            # Fallback: translate individually
-            for idx in batch_indices:
-                if results[idx] is None and idx < len(texts):
-                    results[idx] = translate_text(
-                        texts[idx], target_lang, use_cache)
-
-    # Replace None with original text
-    for i in range(len(results)):
-        if results[i] is None:
-            results[i] = _to_unicode(texts[i])
-
+        translation = " ".join(parts)
+        for i in wanted[text_unicode]:
+            results[i] = translation
+        if use_cache:
+            _cache_translation(
+                text_unicode, target_lang, translation, save=False)
+    if use_cache:
+        save_cache_to_disk()
     return results
 
 
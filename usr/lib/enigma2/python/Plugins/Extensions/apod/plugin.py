@@ -2,15 +2,14 @@
 # -*- coding: utf-8 -*-
 
 import logging
-from json import dump as json_dump, load as json_load
+from json import dumps as json_dumps, load as json_load
 from os import listdir, makedirs, remove
-from os.path import basename, exists, getmtime, getsize, join, splitext, realpath
+from os.path import exists, getsize, join, splitext, realpath
 from re import search
-from shutil import copyfileobj
 from urllib.parse import urlparse
 from datetime import date, timedelta, datetime
-import requests
-from twisted.internet import reactor, threads
+from twisted.internet import defer, reactor, threads
+from twisted.python.failure import Failure
 from twisted.web.client import downloadPage
 from enigma import eServiceReference, eTimer, getDesktop
 from Components.ActionMap import HelpableActionMap
@@ -20,8 +19,8 @@ from Components.Pixmap import Pixmap
 from Components.Sources.List import List
 from Components.config import (
     ConfigSelection,
-    ConfigSubsection,
     ConfigText,
+    ConfigYesNo,
     config,
     getConfigListEntry
 )
@@ -34,8 +33,27 @@ from Plugins.Plugin import PluginDescriptor
 from Tools.Directories import fileExists
 from Tools.LoadPixmap import LoadPixmap
 
-from .google_translate import trans
-from . import _, __version__
+from .google_translate import trans, translate_batch
+from . import _, __version__, CACHE_DIR, TMP_CACHE_DIR
+from .apod_cache import KIND_IMAGE, KIND_THUMB, MB, atomic_write, get_cache
+from .apod_cache import record as cache_record, touch as cache_touch
+from .apod_backfill import Backfill
+from .apod_blobs import get_blobs
+from .apod_daily import DailyPrefetch
+from .apod_download import get_engine
+from .apod_fetcher import APOD_API_URL, RangeFetcher, sync_range
+from .apod_http import SecurityError, validate_url
+from .apod_images import (
+    ImagePrefetcher,
+    MemoryLRU,
+    ThumbnailLoader,
+    scale_image,
+    scaled_path,
+    thumb_path,
+    thumb_source
+)
+from .apod_store import date_str, get_store
+from .apod_video import get_resolver
 from .res.lib.apod_utility import parse_apod
 """
 #########################################################
@@ -121,16 +139,42 @@ Once done, the plugin should be able to access NASA's APOD data and display the
 """
 title_plug = 'Picture of The Day - Nasa %s by %s' % (__version__, __author__)
 plugin_path = '/usr/lib/enigma2/python/Plugins/Extensions/apod'
-CACHE_DIR = "/tmp/apod_cache/"
 
-if not exists(CACHE_DIR):
-    makedirs(CACHE_DIR)
+for folder in (CACHE_DIR, TMP_CACHE_DIR):
+    if not exists(folder):
+        makedirs(folder)
 
-TMP_IMG_PNG = join(CACHE_DIR, "apod.png")
-TMP_IMG_JPG = join(CACHE_DIR, "apod.jpg")
-TMP_IMG_GIF = join(CACHE_DIR, "apod.gif")
-TMP_LOG = join(CACHE_DIR, "apod_debug.log")
+# the debug log is rewritten on every start: keep it off flash and USB
+TMP_LOG = join(TMP_CACHE_DIR, "apod_debug.log")
 TMP_JSON = join(CACHE_DIR, "apod_response.json")
+PAGE_DAYS = 30
+# rows visible in the archive list (both skins) and thumbnails fetched
+# ahead of them
+VISIBLE_ROWS = 10
+THUMB_LOOKAHEAD = 5
+THUMB_SIZE = (75, 75) if screen_width == 1920 else (50, 50)
+# entries prefetched on each side of the cursor, once it has rested for
+# PREFETCH_DELAY ms
+PREFETCH_NEIGHBOURS = 2
+PREFETCH_DELAY = 600
+# ms the splash waits for the refresh while a cached image is shown
+SPLASH_MAX_WAIT = 5000
+# ms a freshly swapped in splash image stays up before the list opens
+SPLASH_MIN_SHOW = 2000
+# decoded detail pixmaps and translated texts kept in memory while
+# flipping through entries
+PIXMAP_CACHE_BYTES = 48 * 1024 * 1024
+TEXT_CACHE_CHARS = 512 * 1024
+# parsed pages of scraped entries, by date (past pages never change)
+PAGE_CACHE_CHARS = 1024 * 1024
+# image widget sizes of the skins below, used when the widget is not
+# laid out yet
+if screen_width == 1920:
+    SPLASH_IMAGE_SIZE = (1920, 1080)
+    DETAIL_IMAGE_SIZE = (1459, 586)
+else:
+    SPLASH_IMAGE_SIZE = (1280, 620)
+    DETAIL_IMAGE_SIZE = (1280, 420)
 DEFAULT_IMAGE = join(plugin_path, "res/icons/default_apod_image.jpg")
 api_key_file = '/etc/apod_api_key'
 api_key_file2 = '/etc/enigma2/apod_api_key'
@@ -138,6 +182,46 @@ today = date.today()
 logger = logging.getLogger(title_plug)
 
 
+# === Helpers ===
+def widget_size(widget, default):
+    """Return the (width, height) of a laid out widget, else `default`."""
+    try:
+        size = widget.instance.size()
+        if size.width() > 0 and size.height() > 0:
+            return (size.width(), size.height())
+    except Exception:
+        pass
+    return default
+
+
+def format_bytes(size):
+    """Human readable byte count."""
+    for unit in ("B", "KB", "MB"):
+        if size < 1024:
+            return "{:.0f} {}".format(size, unit) if unit == "B" else \
+                "{:.1f} {}".format(size, unit)
+        size /= 1024.0
+    return "{:.1f} GB".format(size)
+
+
+def progress_text(received, total, rate):
+    """Status line for a running download."""
+    if total:
+        return "{} {}% ({}/s)".format(
+            _("Downloading..."), int(received * 100 / total),
+            format_bytes(rate))
+    return "{} {} ({}/s)".format(
+        _("Downloading..."), format_bytes(received), format_bytes(rate))
+
+
+def apply_cache_budgets():
+    """Hand the configured cache sizes to the cache index."""
+    get_cache().set_budgets({
+        KIND_IMAGE: int(config.plugins.apod.cache_images.value) * MB,
+        KIND_THUMB: int(config.plugins.apod.cache_thumbs.value) * MB
+    })
+
+
 # === Logging initialization ===
 def init_logging():
     """
@@ -149,13 +233,17 @@ def init_logging():
     handler.setFormatter(formatter)
     logger.addHandler(handler)
     logger.setLevel(logging.DEBUG)
+    # helper modules of the plugin log under the package name
+    package_logger = logging.getLogger(__package__)
+    package_logger.addHandler(handler)
+    package_logger.setLevel(logging.DEBUG)
     logger.info("=== APOD DEBUG START ===")
 
 
 init_logging()
 
 # === Config initialization ===
-config.plugins.apod = ConfigSubsection()
+# config.plugins.apod and its cache_root are created in __init__
 config.plugins.apod.api_key = ConfigText(default="DEMO_KEY", fixed_size=False)
 config.plugins.apod.count = ConfigSelection(
     default="50",
@@ -176,6 +264,15 @@ config.plugins.apod.fetch_mode = ConfigSelection(
         ("recent", _("Recent (date range)"))
     ]
 )
+config.plugins.apod.daily_prefetch = ConfigYesNo(default=True)
+config.plugins.apod.cache_images = ConfigSelection(
+    default="64",
+    choices=[(str(x), "{} MB".format(x)) for x in (16, 32, 64, 128, 256, 512)]
+)
+config.plugins.apod.cache_thumbs = ConfigSelection(
+    default="8",
+    choices=[(str(x), "{} MB".format(x)) for x in (2, 4, 8, 16, 32)]
+)
 try:
     config.plugins.apod.api_key.load()
 except Exception as e:
@@ -188,11 +285,6 @@ Security and Download Improvements
 """
 
 
-class SecurityError(Exception):
-    """Exception raised for security-related errors"""
-    pass
-
-
 class DownloadError(Exception):
     """Exception raised for download-related errors"""
     pass
@@ -206,31 +298,8 @@ class APIError(Exception):
 class SecurityManager:
     @staticmethod
     def validate_url(url):
-        """Validate URL to prevent SSRF attacks"""
-        try:
-            parsed = urlparse(url)
-            if parsed.scheme not in ['http', 'https']:
-                return False
-
-            # Allow only NASA domains and known CDNs
-            allowed_domains = [
-                'apod.nasa.gov',
-                'api.nasa.gov',
-                'www.nasa.gov',
-                'images-assets.nasa.gov',
-                'youtube.com',
-                'youtu.be'
-            ]
-
-            domain = parsed.netloc.lower()
-            if not any(allowed in domain for allowed in allowed_domains):
-                logger.warning(
-                    "Blocked unauthorized domain: {}".format(domain))
-                return False
-
-            return True
-        except Exception:
-            return False
+        """Validate URL to prevent SSRF attacks (see apod_http)"""
+        return validate_url(url)
 
     @staticmethod
     def sanitize_filename(filename):
@@ -321,69 +390,9 @@ class APIKeyManager:
         return False
 
 
-class SecureAPIClient:
-    def __init__(self):
-        self.session = requests.Session()
-        # Configure secure TLS settings
-        self.session.verify = True  # Enable certificate verification
-        self.timeout = 15
-
-    def safe_api_request(self, url, params=None):
-        """Make API request with security measures"""
-        if not SecurityManager.validate_url(url):
-            raise SecurityError("Invalid URL")
-
-        try:
-            response = self.session.get(
-                url,
-                params=params,
-                timeout=self.timeout,
-                headers={
-                    'User-Agent': 'APOD-Plugin/1.6',
-                    'Accept': 'application/json'
-                }
-            )
-
-            if response.status_code != 200:
-                logger.error(
-                    "API request failed: {}".format(
-                        response.status_code))
-                raise APIError(
-                    "API request failed with status code: {}".format(
-                        response.status_code))
-
-            # Validate JSON response
-            data = response.json()
-            if not isinstance(data, (list, dict)):
-                raise APIError("Invalid API response format")
-
-            return data
-
-        except requests.exceptions.SSLError as e:
-            logger.error("SSL error: {}".format(e))
-            raise SecurityError("SSL verification failed: {}".format(e))
-
-        except requests.exceptions.Timeout:
-            logger.error("API request timeout")
-            raise DownloadError("Request timeout")
-
-        except requests.exceptions.ConnectionError:
-            logger.error("Connection error")
-            raise DownloadError("Connection failed")
-
-        except ValueError as e:
-            logger.error("Invalid JSON response: {}".format(e))
-            raise APIError("Invalid API response: {}".format(e))
-
-        except Exception as e:
-            logger.error("Unexpected error: {}".format(e))
-            raise APIError("Unexpected error during API request: {}".format(e))
-
-
 class SecureCacheManager:
     def __init__(self):
         self.cache_dir = CACHE_DIR
-        self.max_cache_size = 100 * 1024 * 1024  # 100MB
         self.cleanup_interval = 24 * 60 * 60  # 24 hours
 
     def secure_cache_path(self, filename):
@@ -396,39 +405,9 @@ class SecureCacheManager:
         return full_path
 
     def cleanup_old_files(self):
-        """Remove old files while respecting cache limits"""
+        """Evict least recently used files over the cache budgets"""
         try:
-            files = []
-            total_size = 0
-
-            for f in listdir(self.cache_dir):
-                if f in ['apod_debug.log', 'apod_response.json']:
-                    continue  # Keep log files
-
-                path = self.secure_cache_path(f)
-                if exists(path):
-                    mtime = getmtime(path)
-                    size = getsize(path)
-                    files.append((path, mtime, size))
-                    total_size += size
-
-            # Sort by modification time (oldest first)
-            files.sort(key=lambda x: x[1])
-
-            # Remove files until under limit
-            while total_size > self.max_cache_size and files:
-                oldest_path, _, size = files.pop(0)
-                try:
-                    remove(oldest_path)
-                    total_size -= size
-                    logger.info("Cleaned cache file: " + basename(oldest_path))
-                except Exception as e:
-                    logger.error(
-                        "Failed to remove " +
-                        str(oldest_path) +
-                        ": " +
-                        str(e))
-
+            get_cache().evict()
         except Exception as e:
             logger.error("Cache cleanup failed: " + str(e))
 
@@ -474,7 +453,19 @@ class APODConfigScreen(ConfigListScreen, Screen):
             # nuova
             getConfigListEntry(
                 _("Sort order:"),
-                config.plugins.apod.sort_order)
+                config.plugins.apod.sort_order),
+            getConfigListEntry(
+                _("Prefetch new APOD daily:"),
+                config.plugins.apod.daily_prefetch),
+            getConfigListEntry(
+                _("Cache location (after restart):"),
+                config.plugins.apod.cache_root),
+            getConfigListEntry(
+                _("Image cache size:"),
+                config.plugins.apod.cache_images),
+            getConfigListEntry(
+                _("Thumbnail cache size:"),
+                config.plugins.apod.cache_thumbs)
         ]
         ConfigListScreen.__init__(self, self.list)
 
@@ -500,6 +491,8 @@ class APODConfigScreen(ConfigListScreen, Screen):
 
         for x in self["config"].list:
             x[1].save()
+        apply_cache_budgets()
+        apply_daily_prefetch()
 
         self.close(True)
 
@@ -536,12 +529,58 @@ class SplashScreen(Screen):
                 "cancel": self.close
             }, -1
         )
+        self.shown_date = None
+        self.done = False
+        self.wait_timer = eTimer()
+        self.wait_timer.callback.append(self.show_list)
+        self.onLayoutFinish.append(self.show_cached)
         self.onLayoutFinish.append(self.start_loading)
 
+    def show_cached(self):
+        """Show the newest stored APOD at once, before any network access."""
+        d = threads.deferToThread(self.read_cached)
+        d.addCallbacks(self.on_cached, self.on_cached_error)
+
+    @staticmethod
+    def read_cached():
+        """(date, image path, entry) of the newest stored APOD, or None."""
+        latest = get_blobs().latest()
+        if not latest:
+            return None
+        day, url, path = latest
+        return day, path, get_store().get(day) or {}
+
+    def on_cached_error(self, failure):
+        logger.warning("No cached splash image: {}".format(
+            failure.getErrorMessage()))
+
+    def on_cached(self, cached):
+        # the refresh may have shown today's image already
+        if not cached or self.done or self.shown_date:
+            return
+        day, path, entry = cached
+        self.shown_date = day
+        # a cached image is up: never hold the user on a slow network
+        self.wait_timer.start(SPLASH_MAX_WAIT, True)
+        self["text"].setText(entry.get("title", ""))
+        size = widget_size(self["image"], SPLASH_IMAGE_SIZE)
+        scaled = scaled_path(path, size)
+        if exists(scaled):
+            # decoded at screen size on an earlier run
+            self.set_image(scaled)
+        else:
+            threads.deferToThread(scale_image, path, size).addCallback(
+                self.show_cached_image, day)
+        logger.info("Splash from cache: {}".format(day))
+
+    def show_cached_image(self, path, day):
+        if self.shown_date == day:
+            self.set_image(path)
+
     def start_loading(self):
         """
-        Kick off a background thread to load today's APOD.
-        Validates API key before proceeding.
+        Refresh today's APOD in the background; validates the API key
+        before proceeding.
         """
         api_key = config.plugins.apod.api_key.value
         if not api_key or api_key == "DEMO_KEY":
@@ -553,127 +592,109 @@ class SplashScreen(Screen):
             )
             return
 
-        threads.deferToThread(self.load_apod).addCallback(self.show_image)
+        size = widget_size(self["image"], SPLASH_IMAGE_SIZE)
+        d = get_engine().get_json(APOD_API_URL, {"api_key": api_key})
+        d.addCallback(self.load_apod, size)
+        d.addErrback(self.on_load_error)
+        d.addCallback(self.show_image)
 
-    def load_apod(self):
-        try:
-            api_key = config.plugins.apod.api_key.value
-            url = "https://api.nasa.gov/planetary/apod?api_key={}".format(
-                api_key)
-            response = requests.get(url, timeout=10)
-            data = response.json()
-
-            logger.info(
-                "APOD API response: {}".format(
-                    data.get(
-                        "title",
-                        "No title")))
-
-            if data.get("media_type") != "image":
-                raise ValueError("Today's APOD is not an image")
-
-            img_url = data.get("url")
-            if img_url.lower().endswith(('.tif', '.tiff')):
-                img_url = data.get("url")
-            logger.info("Image URL: {}".format(img_url))
-
-            # Download image
-            img_response = requests.get(img_url, stream=True, timeout=15)
-            img_response.raise_for_status()
-
-            # Save with correct extension from URL
-            parsed_url = urlparse(img_url)
-            file_ext = splitext(parsed_url.path)[1].lower()
-
-            if file_ext in ['.jpg', '.jpeg']:
-                temp_path = TMP_IMG_JPG
-            elif file_ext == '.png':
-                temp_path = TMP_IMG_PNG
-            elif file_ext == '.gif':
-                temp_path = TMP_IMG_GIF
-            else:
-                temp_path = TMP_IMG_JPG  # default
+    def on_load_error(self, failure):
+        logger.error("Error loading APOD: {}".format(failure.value))
+        return None
 
-            logger.info("Saving to: {}".format(temp_path))
+    def load_apod(self, data, size=SPLASH_IMAGE_SIZE):
+        """Store today's entry off the GUI thread, then fetch its image."""
+        if isinstance(data, list):
+            data = data[0]
+        logger.info(
+            "APOD API response: {}".format(
+                data.get(
+                    "title",
+                    "No title")))
+        d = threads.deferToThread(
+            lambda: get_store().put_entries([data]))
+        d.addCallback(lambda stored: self.load_image(data, size))
+        return d
+
+    def load_image(self, data, size):
+        """Download today's image on the reactor, then scale it."""
+        if data.get("date") and data.get("date") == self.shown_date:
+            logger.info("Cached splash is still today's APOD")
+            return data
+
+        if data.get("media_type") != "image":
+            raise ValueError("Today's APOD is not an image")
 
-            with open(temp_path, "wb") as f:
-                copyfileobj(img_response.raw, f)
+        img_url = data.get("url")
+        logger.info("Image URL: {}".format(img_url))
 
-            logger.info(
-                "File saved, size: {} bytes".format(
-                    getsize(temp_path)))
+        def downloaded(path):
+            logger.info("Image stored as {}, size: {} bytes".format(
+                path, getsize(path)))
+            # decode once at screen size, off the GUI thread
+            return threads.deferToThread(scale_image, path, size)
+
+        def scaled(path):
+            data["local_path"] = path
             return data
 
-        except Exception as e:
-            logger.exception("Error loading APOD: {}".format(e))
-            return None
+        def progress(received, total, rate):
+            if not self.done:
+                self["text"].setText(progress_text(received, total, rate))
+
+        # the archive and detail screens share the same stored copy
+        d = get_blobs().fetch(img_url, data.get("date"), progress)
+        d.addCallback(downloaded)
+        d.addCallback(scaled)
+        return d
 
     def show_image(self, data):
+        if self.done:
+            return
         if data is None:
-            self["text"].setText(_("Failed to load APOD"))
-            reactor.callLater(3, self.show_list)
+            if not self.shown_date:
+                self["text"].setText(_("Failed to load APOD"))
+            self.show_list()
             return
 
         self["text"].setText(data.get("title", ""))
+        image_path = data.get("local_path")
+        if image_path and fileExists(image_path):
+            # only reached when the date changed: swap in the new image
+            self.shown_date = data.get("date")
+            logger.info("Using image: {}".format(image_path))
+            logger.info("File size: {} bytes".format(getsize(image_path)))
+            self.set_image(image_path)
+            # let the new image be seen before the list opens
+            self.wait_timer.start(SPLASH_MIN_SHOW, True)
+            return
 
-        # List all files in the debug cache
-        try:
-            cache_files = listdir(CACHE_DIR)
-            logger.info("Files in cache: {}".format(cache_files))
-        except BaseException:
-            pass
-
-        image_path = None
-        for path in [TMP_IMG_JPG, TMP_IMG_PNG, TMP_IMG_GIF]:
-            if fileExists(path):
-                image_path = path
-                logger.info("Using image: {}".format(path))
-
-                size = getsize(path)
-                logger.info("File size: {} bytes".format(size))
-                break
-
-        if image_path:
-            try:
-                success = self["image"].instance.setPixmapFromFile(image_path)
-                logger.info("setPixmapFromFile result: {}".format(success))
-
-                if not success:
-                    pixmap = LoadPixmap(image_path)
-                    if pixmap:
-                        self["image"].instance.setPixmap(pixmap)
-                        logger.info("LoadPixmap successful")
-                    else:
-                        logger.error("Both methods failed")
+        self.show_list()
 
-            except Exception as e:
-                logger.exception("Display error: {}".format(e))
+    def set_image(self, image_path):
+        try:
+            success = self["image"].instance.setPixmapFromFile(image_path)
+            logger.info("setPixmapFromFile result: {}".format(success))
 
-        reactor.callLater(3, self.show_list)
+            if not success:
+                pixmap = LoadPixmap(image_path)
+                if pixmap:
+                    self["image"].instance.setPixmap(pixmap)
+                    logger.info("LoadPixmap successful")
+                else:
+                    logger.error("Both methods failed")
 
-    def _download_and_show(self, url):
-        """
-        Download a single image and display it immediately.
-        """
-        try:
-            logger.info("Downloading splash fallback from {}".format(url))
-            r = requests.get(url, timeout=10)
-            if r.status_code == 200:
-                with open(TMP_IMG_JPG, "wb") as f:
-                    f.write(r.content)
-                self["image"].instance.setPixmapFromFile(TMP_IMG_JPG)
-            else:
-                self["text"].setText(
-                    _("Failed to fetch image: HTTP {}").format(
-                        r.status_code))
         except Exception as e:
-            logger.exception("Error downloading splash image {}".format(e))
-            self["text"].setText(
-                _("Error downloading image: {}").format(
-                    str(e)))
+            logger.exception("Display error: {}".format(e))
 
     def show_list(self):
         """Open the ArchiveScreen and close this splash."""
+        if self.done:
+            return
+        self.done = True
+        # a refresh still running completes in the background and
+        # stores today's image for the archive
+        self.wait_timer.stop()
         self.session.openWithCallback(self.close, ArchiveScreen)
 
 
@@ -773,6 +794,20 @@ class ArchiveScreen(Screen):
         self.search_active = False
         self.shown = False
         self.raw_data = []
+        self.list_items = []
+        self.rows_by_date = {}
+        self.shown_data = []
+        self.load_generation = 0
+        self.fetcher = None
+        self.thumbs = ThumbnailLoader(CACHE_DIR, THUMB_SIZE)
+        self.thumb_pixmaps = {}
+        self.video_lookups = set()
+        self.titles = {}
+        self.prefetcher = ImagePrefetcher(get_blobs(), DETAIL_IMAGE_SIZE)
+        self.prefetch_timer = eTimer()
+        self.prefetch_timer.callback.append(self.prefetch_neighbours)
+        self.follow_backfill = True
+        apply_cache_budgets()
         self.icons = {
             "image": self.load_pixmap("icon_image.png"),
             "video": self.load_pixmap("icon_video.png"),
@@ -787,10 +822,13 @@ class ArchiveScreen(Screen):
                 "menu": self.open_config,
                 "cancel": self.closeApod,
                 "red": self.closeApod,
+                "yellow": self.toggle_backfill,
                 "blue": self.search_apod,
                 "info": self.show_info
             }, -1)
 
+        self["list"].onSelectionChanged.append(self.request_thumbs)
+        self["list"].onSelectionChanged.append(self.schedule_prefetch)
         self.onLayoutFinish.append(self.start_loading)
 
     def load_pixmap(self, filename):
@@ -819,71 +857,199 @@ class ArchiveScreen(Screen):
 
     def start_loading(self):
         """
-        Start fetching data - clear cache first for fresh data
+        Start fetching data: recent entries come from the local store,
+        which is synced with the API only for the dates it is missing.
+        Recent mode is loaded page by page, newest first.
         """
-        logger.info("=== ARCHIVE SCREEN - CLEARING CACHE ===")
-        logger.info("=== TESTING API KEY ===")
-        try:
-            if exists(TMP_JSON):
-                remove(TMP_JSON)
-                logger.info("Cleared old cache file")
-        except BaseException:
-            pass
+        self.load_generation += 1
+        self.cancel_fetch()
+        self["status"].setText(_("Loading APOD data..."))
+        if config.plugins.apod.fetch_mode.value != "random":
+            self.raw_data = []
+            self.list_items = []
+            self.rows_by_date = {}
+            self.shown_data = []
+            self.search_active = False
+            self["list"].setList([])
+            threads.deferToThread(
+                self.fetch_pages, self.load_generation).addCallbacks(
+                self.on_pages_done,
+                self.on_data_error,
+                callbackArgs=(self.load_generation,)
+            )
+            return
 
-        self["status"].setText(_("Loading fresh APOD data..."))
         threads.deferToThread(self.fetch_data).addCallbacks(
             self.on_data_fetched,
             self.on_data_error
         )
 
     def fetch_data(self):
-        """Fetch APOD entries: random or recent date range."""
+        """Fetch random APOD entries (recent mode is loaded by pages)."""
         try:
             count = int(config.plugins.apod.count.value)
             api_key = config.plugins.apod.api_key.value
-            fetch_mode = config.plugins.apod.fetch_mode.value
 
             if not APIKeyManager.is_valid_api_key(api_key):
                 logger.error("Invalid API key")
                 return []
 
-            url = "https://api.nasa.gov/planetary/apod"
-            params = {'api_key': api_key}
-
-            if fetch_mode == "random":
-                params['count'] = count
-                logger.info(f"Fetching {count} random APODs")
-            else:   # modalità "recent"
-                # Limita a max 365 giorni per evitare timeout (puoi aumentare)
-                days = min(count, 365)
-                today = date.today()
-                start_date = today - timedelta(days=days)
-                params['start_date'] = start_date.strftime('%Y-%m-%d')
-                params['end_date'] = today.strftime('%Y-%m-%d')
-                logger.info(
-                    f"Fetching APODs from {params['start_date']} "
-                    f"to {params['end_date']}"
-                )
-
-            response = requests.get(url, params=params, timeout=30)
-            logger.info(f"Response status: {response.status_code}")
-
-            if response.status_code == 200:
-                data = response.json()
-                logger.info(f"Received {len(data)} entries")
+            logger.info(f"Fetching {count} random APODs")
+            # worker thread: cancel_fetch() may reset self.fetcher meanwhile
+            fetcher = self.fetcher = RangeFetcher(api_key)
+            try:
+                data, failed = fetcher.fetch_random(count)
+            finally:
+                fetcher.close()
+            if failed:
+                logger.error("{} random chunk(s) failed".format(len(failed)))
+            logger.info(f"Received {len(data)} entries")
+            if data:
                 # Salva in cache
-                with open(TMP_JSON, 'w') as f:
-                    json_dump(data, f)
-                return data
-            else:
-                logger.error(
-                    f"API error {response.status_code}: {response.text[:200]}")
-                return []
+                atomic_write(TMP_JSON, json_dumps(data))
+                cache_record(TMP_JSON)
+                get_store().put_entries(data)
+            return data
 
         except Exception as e:
             logger.exception(f"Fetch data exception: {e}")
             return []
 
+    def recent_window(self):
+        """Return the (start, end) dates of the configured recent window."""
+        days = min(int(config.plugins.apod.count.value), 365)
+        end_date = date.today()
+        return end_date - timedelta(days=days), end_date
+
+    def fetch_pages(self, generation):
+        """
+        Worker thread: show what the store already holds for the recent
+        window, then fetch the missing dates in parallel PAGE_DAYS chunks,
+        newest first, handing every chunk to the GUI as soon as it arrives.
+        """
+        api_key = config.plugins.apod.api_key.value
+        start_date, end_date = self.recent_window()
+        store = get_store()
+        stored = store.get_range(start_date, end_date)
+        if stored:
+            reactor.callFromThread(self.on_page_fetched, generation, stored)
+        if not APIKeyManager.is_valid_api_key(api_key):
+            logger.error("Invalid API key, using stored entries only")
+            return len(stored)
+
+        fetcher = self.fetcher = RangeFetcher(api_key, chunk_days=PAGE_DAYS)
+
+        def on_chunk(chunk, entries):
+            if generation != self.load_generation:
+                fetcher.cancel()
+                return
+            reactor.callFromThread(self.on_page_fetched, generation, entries)
+
+        try:
+            added = sync_range(
+                store, api_key, start_date, end_date,
+                on_chunk=on_chunk, fetcher=fetcher)
+        finally:
+            fetcher.close()
+        return len(stored) + added
+
+    def cancel_fetch(self):
+        if self.fetcher is not None:
+            self.fetcher.cancel()
+            self.fetcher = None
+
+    def toggle_backfill(self):
+        """Start the download of the whole archive, or stop it."""
+        if backfill_job is not None:
+            backfill_job.cancel()
+            self["status"].setText(_("Stopping archive download..."))
+            return
+        self.session.openWithCallback(
+            self.start_backfill,
+            MessageBox,
+            _("Download the whole APOD archive since 1995 into the local "
+              "store?\nIt runs in the background and resumes where it "
+              "stopped. Press yellow again to stop it."),
+            MessageBox.TYPE_YESNO)
+
+    def start_backfill(self, answer):
+        global backfill_job
+        if not answer or backfill_job is not None:
+            return
+        job = backfill_job = Backfill()
+        self["status"].setText(_("Archive download started"))
+
+        def on_progress(done, total):
+            reactor.callFromThread(self.on_backfill_progress, done, total)
+
+        threads.deferToThread(job.run, on_progress).addBoth(
+            self.on_backfill_done)
+
+    def on_backfill_progress(self, done, total):
+        if self.follow_backfill:
+            self["status"].setText(_("Archive download: {} / {} days").format(
+                done, total))
+
+    def on_backfill_done(self, result):
+        global backfill_job
+        backfill_job = None
+        if isinstance(result, Failure):
+            logger.error("Archive download failed: {}".format(
+                result.getErrorMessage()))
+            message = _("Archive download failed")
+        else:
+            message = _("Archive download: {} new entries").format(result)
+        if self.follow_backfill:
+            self["status"].setText(message)
+
+    def on_page_fetched(self, generation, page):
+        """Merge one chunk of entries into the list (GUI thread)."""
+        if generation != self.load_generation:
+            return
+        page = [
+            x for x in page
+            if x.get("date") and x["date"] not in self.rows_by_date]
+        if not page:
+            return
+        for item in page:
+            self.rows_by_date[item["date"]] = self.make_entry(item)
+
+        # chunks can complete in any order: keep the cursor on its entry
+        current = None
+        if self.raw_data and not self.search_active:
+            index = self["list"].getIndex()
+            if 0 <= index < len(self.raw_data):
+                current = self.raw_data[index].get("date")
+
+        ascending = config.plugins.apod.sort_order.value == "Ascending"
+        self.raw_data.extend(page)
+        self.raw_data.sort(
+            key=lambda x: x.get("date", ""), reverse=not ascending)
+        self.list_items = [self.rows_by_date[x["date"]] for x in self.raw_data]
+
+        if not self.search_active:
+            self.shown_data = self.raw_data
+            self["list"].setList(self.list_items)
+            if current is not None:
+                for index, item in enumerate(self.raw_data):
+                    if item["date"] == current:
+                        self["list"].setIndex(index)
+                        break
+            self["status"].setText(
+                _("Loading... {} entries").format(len(self.list_items)))
+            self.request_thumbs()
+        self.translate_titles(page)
+
+    def on_pages_done(self, total, generation):
+        if generation != self.load_generation:
+            return
+        logger.info("Paged loading finished: {} entries".format(total))
+        if not self.raw_data:
+            self["status"].setText(_("No data available. Check API key."))
+        elif not self.search_active:
+            self["status"].setText(
+                _("Found {} entries").format(len(self.raw_data)))
+
     def on_data_fetched(self, data):
         """
         Called once fresh data is fetched.
@@ -913,6 +1079,8 @@ class ArchiveScreen(Screen):
     def load_cached_data(self):
         """Load data from cache if present"""
         try:
+            if config.plugins.apod.fetch_mode.value != "random":
+                return get_store().get_range(*self.recent_window())
             if exists(TMP_JSON):
                 with open(TMP_JSON, 'r') as f:
                     data = json_load(f)
@@ -944,30 +1112,19 @@ class ArchiveScreen(Screen):
             list_items = []
             for item in data:
                 try:
-                    media_type = item.get("media_type", "image")
-                    url = item.get("url", "")
-
-                    if url.lower().endswith(".gif"):
-                        icon_type = "gif"
-                    elif media_type == "video":
-                        icon_type = "video"
-                    else:
-                        icon_type = "image"
-
-                    list_items.append((
-                        self.icons.get(icon_type),      # Icon
-                        item.get("date", "N/A"),        # Date
-                        item.get("title", "Untitled"),  # Title
-                        url,                            # Image or video URL
-                        item.get("explanation", ""),    # Description
-                        media_type                      # Media type
-                    ))
+                    list_items.append(self.make_entry(item))
                 except Exception as e:
                     logger.warning("Skipped invalid APOD entry: {}".format(e))
                     continue
 
             logger.info("Built list with {} entries".format(len(list_items)))
+            if data is self.raw_data:
+                self.list_items = list_items
+            self.shown_data = data
             self["list"].setList(list_items)
+            self.request_thumbs()
+            self.schedule_prefetch()
+            self.translate_titles(data)
             self["status"].setText(
                 _("Found {} entries").format(
                     len(list_items)))
@@ -976,22 +1133,186 @@ class ArchiveScreen(Screen):
             logger.error("Build list failed: {}".format(e))
             self["status"].setText(_("Error building list"))
 
+    def make_entry(self, item):
+        """Build one list row from an APOD entry."""
+        media_type = item.get("media_type", "image")
+        url = item.get("url", "")
+
+        if url.lower().endswith(".gif"):
+            icon_type = "gif"
+        elif media_type == "video":
+            icon_type = "video"
+        else:
+            icon_type = "image"
+
+        icon = self.thumb_pixmaps.get(item.get("date"))
+        title = item.get("title", "Untitled")
+        return (
+            icon or self.icons.get(icon_type),  # Thumbnail or icon
+            item.get("date", "N/A"),        # Date
+            self.titles.get(title) or title,  # Title
+            url,                            # Image or video URL
+            item.get("explanation", ""),    # Description
+            media_type                      # Media type
+        )
+
+    def translate_titles(self, items):
+        """
+        Translate the titles of `items` not translated yet in a worker
+        thread: translate_batch packs them into one or two requests.
+        """
+        titles = []
+        for item in items:
+            title = item.get("title")
+            if title and title not in self.titles:
+                # placeholder so each title is requested only once
+                self.titles[title] = None
+                titles.append(title)
+        if not titles:
+            return
+        d = threads.deferToThread(translate_batch, titles)
+        d.addCallback(self.on_titles_translated, titles, self.load_generation)
+        d.addErrback(self.on_titles_error, titles)
+
+    def on_titles_translated(self, translated, titles, generation):
+        changed = set()
+        for title, text in zip(titles, translated):
+            if self.titles.get(title) is not None:
+                continue
+            if text and text != title:
+                self.titles[title] = text
+                changed.add(title)
+            else:
+                # failed or unchanged: asked for again with the next page
+                self.titles.pop(title, None)
+        if changed and generation == self.load_generation:
+            self.update_rows(lambda item: item.get("title") in changed)
+
+    def on_titles_error(self, failure, titles):
+        logger.error("Title translation failed: {}".format(
+            failure.getErrorMessage()))
+        for title in titles:
+            if self.titles.get(title) is None:
+                self.titles.pop(title, None)
+
+    def update_rows(self, match):
+        """Rebuild the shown rows of the entries `match` accepts."""
+        for index, item in enumerate(self.shown_data):
+            if not match(item):
+                continue
+            row = self.make_entry(item)
+            self.rows_by_date[item["date"]] = row
+            if self.shown_data is self.raw_data and index < len(self.list_items):
+                self.list_items[index] = row
+            self["list"].modifyEntry(index, row)
+
+    def request_thumbs(self):
+        """
+        Ask for the thumbnails of the rows on the current list page plus a
+        small lookahead; queued requests for other rows are dropped.
+        """
+        if not self.shown_data:
+            return
+        index = self["list"].getIndex() or 0
+        first = index - index % VISIBLE_ROWS
+        window = self.shown_data[first:first + VISIBLE_ROWS + THUMB_LOOKAHEAD]
+        urls = []
+        for item in window:
+            if item.get("media_type") == "video" and \
+                    "thumbnail_url" not in item:
+                self.resolve_video_thumb(item)
+            url = thumb_source(item)
+            if url and item.get("date") not in self.thumb_pixmaps:
+                urls.append(url)
+        self.thumbs.keep(urls)
+        for url in urls:
+            self.thumbs.request(url, self.on_thumb_ready)
+
+    def resolve_video_thumb(self, item):
+        """
+        Find the thumbnail of a video row; API entries do not carry it.
+        Vimeo lookups run in the background and the row is updated when
+        they complete.
+        """
+        url = item.get("url")
+        if not url or item.get("date") in self.video_lookups:
+            return
+        resolver = get_resolver()
+        thumb = resolver.cached(url)
+        if thumb is not None:
+            item["thumbnail_url"] = thumb
+            return
+        self.video_lookups.add(item.get("date"))
+        resolver.resolve(url).add_done_callback(
+            lambda future: reactor.callFromThread(
+                self.on_video_thumb, item, future))
+
+    def on_video_thumb(self, item, future):
+        if self.thumbs.closed:
+            # the screen closed while the lookup ran
+            return
+        self.video_lookups.discard(item.get("date"))
+        try:
+            item["thumbnail_url"] = future.result()
+        except Exception as e:
+            logger.warning("Video thumbnail of %s: %s", item.get("date"), e)
+            return
+        if item["thumbnail_url"]:
+            self.thumbs.request(item["thumbnail_url"], self.on_thumb_ready)
+
+    def schedule_prefetch(self):
+        """Restart the prefetch delay; fast scrolling never prefetches."""
+        self.prefetch_timer.start(PREFETCH_DELAY, True)
+
+    def prefetch_neighbours(self):
+        """
+        Prefetch the images of the selected entry and its neighbours,
+        nearest first; anything queued for other entries is dropped.
+        """
+        count = len(self.shown_data)
+        if not count:
+            return
+        index = self["list"].getIndex() or 0
+        order = [index]
+        for step in range(1, PREFETCH_NEIGHBOURS + 1):
+            order.extend((index + step, index - step))
+        entries = [self.shown_data[i] for i in order if 0 <= i < count]
+        self.prefetcher.schedule(entries)
+
+    def on_thumb_ready(self, url, path):
+        """Swap the generic icon of the rows using `url` for its thumbnail."""
+        pixmap = LoadPixmap(path)
+        if not pixmap:
+            return
+        for item in self.shown_data:
+            if thumb_source(item) == url:
+                self.thumb_pixmaps[item["date"]] = pixmap
+        self.update_rows(lambda item: thumb_source(item) == url)
+
     def show_details(self):
         """
-        Opens the DetailScreen with the currently selected APOD entry.
+        Opens the DetailScreen with the currently selected APOD entry;
+        left/right there browse the displayed list.
         """
         selected_index = self["list"].getIndex()
-        if selected_index < len(self.raw_data):
-            entry = self.raw_data[selected_index]
-            self.session.open(DetailScreen, entry)
+        if selected_index < len(self.shown_data):
+            entry = self.shown_data[selected_index]
+            self.session.openWithCallback(
+                self.on_details_closed,
+                DetailScreen, entry, self.shown_data, selected_index)
+
+    def on_details_closed(self, index=None):
+        """Follow the entry the user browsed to in the DetailScreen."""
+        if index is not None and 0 <= index < len(self.shown_data):
+            self["list"].setIndex(index)
 
     def show_info(self):
         """
         Show a message box with the title and explanation of the selected APOD entry.
         """
         idx = self["list"].getIndex()
-        if 0 <= idx < len(self.raw_data):
-            entry = self.raw_data[idx]
+        if 0 <= idx < len(self.shown_data):
+            entry = self.shown_data[idx]
             title = entry.get("title", "No Title")
             explanation = entry.get("explanation", "No Description")
             # Translate title and explanation
@@ -1016,9 +1337,11 @@ class ArchiveScreen(Screen):
         if not result:
             return
         term = result.lower()
+        # the list shows the translated titles: match both
         self.filtered_data = [
-            e for e in self.raw_data if term in e.get(
-                "title", "").lower()]
+            e for e in self.raw_data
+            if term in e.get("title", "").lower() or
+            term in (self.titles.get(e.get("title")) or "").lower()]
         self.search_active = True
         self.build_list(self.filtered_data)
         self["status"].setText(
@@ -1054,6 +1377,17 @@ class ArchiveScreen(Screen):
             self["status"].setText(
                 _("Found " + str(len(self.raw_data)) + " entries"))
         else:
+            # stop any page still being loaded
+            self.load_generation += 1
+            self.cancel_fetch()
+            # the archive download goes on in the background
+            self.follow_backfill = False
+            self.thumbs.close()
+            self.video_lookups.clear()
+            # nothing of the plugin stays in RAM once it is closed
+            DetailScreen.clear_caches()
+            self.prefetch_timer.stop()
+            self.prefetcher.close()
             self.clean_cache()
             self.close()
 
@@ -1088,90 +1422,188 @@ class DetailScreen(Screen):
             <eLabel name="" position="1199,5" size="70,70" backgroundColor="#002a2a2a" halign="center" valign="center" transparent="0" cornerRadius="40" font="Regular; 17" zPosition="3" text="INFO" />
         </screen>"""
 
-    def __init__(self, session, data):
+    # shared by the detail screens opened from one archive list, which
+    # empties them when it closes (see clear_caches())
+    pixmap_cache = MemoryLRU(PIXMAP_CACHE_BYTES)
+    text_cache = MemoryLRU(TEXT_CACHE_CHARS)
+    page_cache = MemoryLRU(PAGE_CACHE_CHARS)
+
+    @classmethod
+    def clear_caches(cls):
+        """Free the decoded pixmaps, texts and pages kept in memory."""
+        cls.pixmap_cache.clear()
+        cls.text_cache.clear()
+        cls.page_cache.clear()
+
+    def __init__(self, session, data, entries=None, index=0):
         Screen.__init__(self, session)
         self.session = session
+        self.entries = entries or [data]
+        self.index = index if entries else 0
         self.data = data
         self.active = True
+        self.layout_done = False
+        self.download = None
+        self.preview_download = None
+        self.preview_shown = None
+        self.hd_shown = None
+        self.page_fetch = None
         self["image"] = Pixmap()
         self["description"] = Label("")
-
-        # Translate title
-        title_raw = self.data.get("title", "")
-        self.translated_title = trans(title_raw) if title_raw else ""
-        self["title"] = Label(self.translated_title)
-
-        # Translate date if it contains month names (e.g. "2026 April 18")
-        date_raw = self.data.get("date", "")
-        if date_raw and any(c.isalpha() for c in date_raw):
-            date_trans = trans(date_raw)
-        else:
-            date_trans = date_raw
-        self["date"] = Label(date_trans)
+        self["title"] = Label("")
+        self["date"] = Label("")
 
         self["actions"] = HelpableActionMap(
             self, "ApodActions",
             {
                 "ok": self.on_ok,
                 "cancel": self.close,
-                "info": self.show_info
+                "info": self.show_info,
+                "left": self.show_previous,
+                "right": self.show_next
             }, -1
         )
 
+        self.set_entry(self.index)
+        self.onLayoutFinish.append(self.on_layout_finished)
+
+    def on_layout_finished(self):
+        self.layout_done = True
+        self.load_media()
+
+    def set_entry(self, index):
+        """Show the entry at `index` of self.entries."""
+        self.stop_gif()
+        self.cancel_download()
+        self.page_fetch = None
+        self.index = index
+        self.data = self.entries[index]
+
+        # Translate title
+        self.translated_title = self.translated(
+            "title", self.data.get("title", ""))
+        self["title"].setText(self.translated_title)
+
+        # Translate date if it contains month names (e.g. "2026 April 18")
+        date_raw = self.data.get("date", "")
+        if date_raw and any(c.isalpha() for c in date_raw):
+            date_trans = self.translated("date", date_raw)
+        else:
+            date_trans = date_raw
+        self["date"].setText(date_trans)
+
         # If essential fields are missing (e.g. from scraping), fetch them
         if 'explanation' not in self.data or 'url' not in self.data or 'media_type' not in self.data:
             self.fetch_missing_data()
-        else:
-            self.onLayoutFinish.append(self.load_media)
+
+    def show_previous(self):
+        self.step(-1)
+
+    def show_next(self):
+        self.step(1)
+
+    def step(self, offset):
+        if not self.active or len(self.entries) < 2:
+            return
+        self.set_entry((self.index + offset) % len(self.entries))
+        if self.layout_done:
+            self.load_media()
+
+    def translated(self, field, text):
+        """Translate an entry text, re-using what is already in memory."""
+        if not text:
+            return ""
+        key = (self.data.get("date"), field, text)
+        cached = self.text_cache.get(key)
+        if cached is None:
+            cached = trans(text)
+            self.text_cache.put(key, cached, len(cached))
+        return cached
+
+    def explanation_text(self):
+        explanation = self.data.get("explanation_translated")
+        if not explanation:
+            explanation = self.translated(
+                "explanation", self.data.get("explanation", ""))
+            if explanation:
+                self.data['explanation_translated'] = explanation
+        return explanation
 
     def fetch_missing_data(self):
-        """Fetch missing explanation, URL, media_type from the individual APOD page using parse_apod."""
+        """
+        Complete a scraped entry with explanation, url and media_type:
+        from memory when its page was parsed before, otherwise from the
+        local store or the page itself in a worker thread.
+        """
         try:
-            # page_url = self.data.get('page_url')
-            date_str = self.data.get('date')
-            if not date_str:
-                logger.error("No date or page_url to fetch missing data")
-                self.onLayoutFinish.append(self.load_media)
-                return
+            day = date_str(self.data.get('date'))
+        except (AttributeError, TypeError, ValueError):
+            logger.error("Unable to parse date: {}".format(
+                self.data.get('date')))
+            self.fill_missing("No description available")
+            return
+        props = self.page_cache.get(day)
+        if props is not None:
+            self.data.update(props)
+            return
+        self.page_fetch = threads.deferToThread(self.load_page, day)
+        self.page_fetch.addCallbacks(
+            self.on_page_parsed, self.on_page_error,
+            callbackArgs=(self.data, day), errbackArgs=(self.data,))
 
-            # Parse date string to date object
-            try:
-                if '-' in date_str:
-                    dt = datetime.datetime.strptime(
-                        date_str, "%Y-%m-%d").date()
-                else:
-                    dt = datetime.datetime.strptime(
-                        date_str, "%Y %B %d").date()
-            except BaseException:
-                logger.error(f"Unable to parse date: {date_str}")
-                self.onLayoutFinish.append(self.load_media)
-                return
+    @staticmethod
+    def load_page(day):
+        """
+        Worker thread: the stored props of `day` when its page was parsed
+        before, else parse the APOD page and store it.
+        """
+        props = get_store().get(day)
+        if props and props.get("explanation"):
+            return props
+        props = parse_apod(
+            datetime.strptime(day, "%Y-%m-%d"),
+            use_default_today_date=False, thumbs=False)
+        if props:
+            get_store().put_entries([props])
+        return props
+
+    def on_page_parsed(self, props, data, day):
+        if props:
+            self.page_cache.put(day, props, len(props.get("explanation", "")))
+            data.update(props)
+            logger.info("Fetched missing data for {}".format(day))
+        if data is not self.data:
+            # the user moved on meanwhile
+            return
+        self.page_fetch = None
+        if not props:
+            self.fill_missing("No description available")
+        if self.active and self.layout_done:
+            self.load_media()
+
+    def on_page_error(self, failure, data):
+        logger.error("Error fetching missing data: {}".format(
+            failure.getErrorMessage()))
+        if data is not self.data:
+            return
+        self.page_fetch = None
+        self.fill_missing("Error loading details")
+        if self.active and self.layout_done:
+            self.load_media()
 
-            full_data = parse_apod(
-                dt, use_default_today_date=False, thumbs=False)
-            if full_data:
-                self.data.update(full_data)
-                if 'explanation' in full_data:
-                    self.data['explanation_translated'] = trans(
-                        full_data['explanation'])
-                logger.info(f"Fetched missing data for {date_str}")
-            else:
-                # Fallback dummy data
-                self.data['explanation'] = "No description available"
-                self.data['media_type'] = 'image'
-                self.data['url'] = ''
-        except Exception as e:
-            logger.exception(f"Error fetching missing data: {e}")
-            self.data['explanation'] = "Error loading details"
-            self.data['media_type'] = 'image'
-            self.data['url'] = ''
-        finally:
-            self.onLayoutFinish.append(self.load_media)
+    def fill_missing(self, explanation):
+        self.data.setdefault('explanation', explanation)
+        self.data.setdefault('media_type', 'image')
+        self.data.setdefault('url', '')
 
     def load_media(self):
         """Branch: image, video, or GIF."""
         if not self.active:
             return
+        if self.page_fetch is not None:
+            # on_page_parsed() comes back here
+            self["description"].setText(_("Loading..."))
+            return
 
         mt = self.data.get("media_type", "image")
         if mt == "image":
@@ -1182,75 +1614,189 @@ class DetailScreen(Screen):
             url = self.data.get("hdurl") or self.data.get("url")
             self.show_animated_gif(url)
         else:
-            explanation = self.data.get(
-                "explanation_translated") or self.data.get("explanation", "")
-            if explanation and not self.data.get("explanation_translated"):
-                explanation = trans(explanation)
-                self.data['explanation_translated'] = explanation
-            self["description"].setText(explanation)
+            self["description"].setText(self.explanation_text())
 
     def load_image(self, url=None, force=False):
-        """Download and display the image."""
-        self["description"].setText(trans("Loading image..."))
-        if not url:
-            url = self.data.get("hdurl") or self.data.get("url")
-            if not url:
+        """
+        Display the image. Without an explicit url the small `url` image
+        (or the archive thumbnail) is shown at once and `hdurl` replaces
+        it as soon as it is downloaded and decoded.
+        """
+        if url:
+            self.show_single(url, force)
+            return
+        low_url = self.data.get("url")
+        hd_url = self.data.get("hdurl")
+        if not hd_url or hd_url == low_url:
+            if not low_url:
                 self["description"].setText(trans("No image URL available"))
                 return
+            self.show_single(low_url)
+            return
 
-        if not force:
-            parsed_url = urlparse(url)
-            file_ext = splitext(parsed_url.path)[1].lower() or ".jpg"
-            filename = "{}{}".format(self.data['date'], file_ext)
-            local_path = join(CACHE_DIR, filename)
+        date = self.data['date']
+        pixmap = self.pixmap_cache.get((date, hd_url))
+        if pixmap is not None:
+            # already decoded: no disk or network access
+            self.hd_shown = date
+            self["image"].instance.setPixmap(pixmap)
+            self["description"].setText(self.explanation_text())
+            return
 
-            if exists(local_path):
-                self.update_image(local_path)
+        hd_path = get_blobs().lookup(hd_url)
+        if hd_path:
+            # decoding a local HD copy is quicker than any preview
+            self.update_image(hd_path, hd_url)
+            return
+
+        if low_url:
+            self.show_preview(low_url)
+        self.download_image(hd_url)
+
+    def show_single(self, url, force=False):
+        """Display one image url, downloading it if needed."""
+        if not force:
+            pixmap = self.pixmap_cache.get((self.data['date'], url))
+            if pixmap is not None:
+                self["image"].instance.setPixmap(pixmap)
+                self["description"].setText(self.explanation_text())
                 return
 
-        self.download_image(url, local_path if not force else None)
+        self["description"].setText(trans("Loading image..."))
+        local_path = get_blobs().lookup(url)
+        if local_path:
+            self.update_image(local_path, url)
+            return
 
-    def download_image(self, url, local_path=None):
-        """Download image using downloadPage."""
+        self.download_image(url)
+
+    def show_preview(self, url):
+        """First stage: the low resolution image, from memory if possible."""
+        date = self.data['date']
+        key = (date, url)
+        pixmap = self.pixmap_cache.get(key)
+        if pixmap is not None:
+            self.preview_shown = date
+            self["image"].instance.setPixmap(pixmap)
+            self["description"].setText(self.explanation_text())
+            return
+        path = get_blobs().lookup(url)
+        if path:
+            self.update_image(path, url, key, preview=True)
+            return
+        thumb = thumb_path(CACHE_DIR, url, THUMB_SIZE)
+        if exists(thumb):
+            # stretched list thumbnail while the preview downloads
+            self.show_scaled_image(thumb, (date, None), preview=True)
+        else:
+            self["description"].setText(trans("Loading image..."))
+        self.preview_download = get_blobs().fetch(url, date)
+        self.preview_download.addCallbacks(
+            lambda path: self.update_image(path, url, key, preview=True),
+            self.on_preview_error, errbackArgs=(url,)
+        )
+
+    def on_preview_error(self, failure, url):
+        # paging away cancels the preview: nothing to report
+        if failure.check(defer.CancelledError):
+            return
+        logger.warning("Preview download failed for {}: {}".format(
+            url, failure.value))
+
+    def download_image(self, url):
+        """Download the image into the shared image store."""
         try:
-            if not local_path:
-                parsed_url = urlparse(url)
-                file_ext = splitext(parsed_url.path)[1].lower() or ".jpg"
-                filename = "{}{}".format(self.data['date'], file_ext)
-                local_path = join(CACHE_DIR, filename)
             logger.info("Downloading image: {}".format(url))
-            downloadPage(
-                url.encode('utf-8'),
-                local_path
-            ).addCallbacks(
-                lambda result: self.update_image(local_path),
-                lambda failure: self.handle_download_error(failure, url)
+            key = (self.data['date'], url)
+            if self.download is not None and not self.download.called:
+                self.download.cancel()
+
+            def progress(received, total, rate):
+                # keep the explanation readable under a preview
+                if (self.active and key[0] == self.data.get('date') and
+                        self.preview_shown != key[0]):
+                    self["description"].setText(
+                        progress_text(received, total, rate))
+
+            self.download = get_blobs().fetch(url, key[0], progress)
+            self.download.addCallbacks(
+                lambda path: self.update_image(path, url, key),
+                lambda failure: self.handle_download_error(failure, url, key)
             )
         except Exception as e:
             logger.error("Download error: {}".format(e))
             self.handle_download_error(e, url)
 
-    def update_image(self, path):
-        """Display the image and set the translated explanation."""
+    def update_image(self, path, url=None, key=None, preview=False):
+        """Scale the image to the widget off the GUI thread, then show it."""
+        key = key or (self.data['date'], url)
+        if key[0] != self.data.get('date'):
+            # the user moved on to another entry meanwhile
+            return
         if exists(path):
-            try:
-                self["image"].instance.setPixmapFromFile(path)
-                explanation = self.data.get(
-                    "explanation_translated") or self.data.get("explanation", "")
-                if explanation and not self.data.get("explanation_translated"):
-                    explanation = trans(explanation)
-                    self.data['explanation_translated'] = explanation
-                self["description"].setText(explanation)
-                logger.info("Image displayed: {}".format(path))
-            except Exception as e:
-                logger.error("Failed to display image: {}".format(e))
-                self["description"].setText(trans("Error displaying image"))
+            cache_touch(path)
+            size = widget_size(self["image"], DETAIL_IMAGE_SIZE)
+            threads.deferToThread(scale_image, path, size).addCallbacks(
+                lambda scaled: self.show_scaled_image(scaled, key, preview),
+                lambda failure: self.show_scaled_image(path, key, preview)
+            )
         else:
             logger.warning("Image file not found: {}".format(path))
             self["description"].setText(trans("Image not available"))
 
-    def handle_download_error(self, error, url):
+    def show_scaled_image(self, path, key=None, preview=False):
+        """Display the image and set the translated explanation."""
+        if not self.active:
+            return
+        if key and key[0] != self.data.get('date'):
+            return
+        if preview and self.hd_shown == key[0]:
+            # the HD image won the race
+            return
+        try:
+            pixmap = LoadPixmap(path)
+            if pixmap:
+                self["image"].instance.setPixmap(pixmap)
+                if key and key[1]:
+                    self.pixmap_cache.put(key, pixmap, self.pixmap_bytes(pixmap))
+            else:
+                self["image"].instance.setPixmapFromFile(path)
+            if preview:
+                self.preview_shown = key[0]
+            else:
+                self.hd_shown = key[0] if key else None
+            self["description"].setText(self.explanation_text())
+            logger.info("Image displayed: {}".format(path))
+        except Exception as e:
+            logger.error("Failed to display image: {}".format(e))
+            self["description"].setText(trans("Error displaying image"))
+
+    def pixmap_bytes(self, pixmap):
+        """Approximate memory used by a decoded pixmap."""
+        try:
+            size = pixmap.size()
+            return size.width() * size.height() * 4
+        except Exception:
+            width, height = widget_size(self["image"], DETAIL_IMAGE_SIZE)
+            return width * height * 4
+
+    def cancel_download(self):
+        """Abort the transfers of images nobody is waiting for."""
+        self.preview_shown = self.hd_shown = None
+        for download in (self.download, self.preview_download):
+            if download is not None and not download.called:
+                download.cancel()
+        self.download = self.preview_download = None
+
+    def handle_download_error(self, error, url, key=None):
+        if isinstance(error, Failure) and error.check(defer.CancelledError):
+            return
         logger.error("Download failed for {}: {}".format(url, error))
+        if key and key[0] != self.data.get('date'):
+            return
+        if key and self.preview_shown == key[0]:
+            # the preview stays up, only the HD upgrade failed
+            return
         self["description"].setText(trans("Failed to download image"))
 
     def on_ok(self):
@@ -1327,11 +1873,16 @@ class DetailScreen(Screen):
             return
         self["image"].instance.setPixmap(self.picload.getData())
 
+    def stop_gif(self):
+        if hasattr(self, 'gif_timer'):
+            self.gif_timer.stop()
+        if hasattr(self, 'picload'):
+            self.picload = None
+
     def show_info(self):
         title = self.translated_title or trans(
             self.data.get("title", "No Title"))
-        explanation = self.data.get("explanation_translated") or trans(
-            self.data.get("explanation", "No Description"))
+        explanation = self.explanation_text() or trans("No Description")
         msg = "{}\n\n{}".format(title, explanation)
         self.session.open(MessageBox, msg, MessageBox.TYPE_INFO)
 
@@ -1341,11 +1892,9 @@ class DetailScreen(Screen):
 
     def close(self):
         self.active = False
-        if hasattr(self, 'picload'):
-            self.picload = None
-        if hasattr(self, 'gif_timer'):
-            self.gif_timer.stop()
-        Screen.close(self)
+        self.stop_gif()
+        self.cancel_download()
+        Screen.close(self, self.index)
 
 
 class DetailScreen222222(Screen):
@@ -1668,14 +2217,53 @@ def main(session, **kwargs):
         session.open(APODConfigScreen)
 
 
+daily_prefetch = None
+backfill_job = None
+
+
+def apply_daily_prefetch():
+    """Start or stop the daily background prefetch to match its setting."""
+    global daily_prefetch
+    if not config.plugins.apod.daily_prefetch.value:
+        if daily_prefetch is not None:
+            daily_prefetch.stop()
+        logger.info("Daily prefetch disabled")
+        return
+    if daily_prefetch is None:
+        APIKeyManager.load_apikey_from_file()
+        daily_prefetch = DailyPrefetch(
+            lambda: config.plugins.apod.api_key.value,
+            (SPLASH_IMAGE_SIZE, DETAIL_IMAGE_SIZE),
+            THUMB_SIZE,
+            CACHE_DIR,
+            lambda: config.plugins.apod.daily_prefetch.value
+        )
+    elif daily_prefetch.call is not None and daily_prefetch.call.active():
+        # already scheduled
+        return
+    daily_prefetch.start()
+
+
+def sessionstart(reason, session=None, **kwargs):
+    """Start the daily background prefetch with the GUI session."""
+    if reason == 0:
+        apply_daily_prefetch()
+
+
 def plugins(**kwargs):
-    return [PluginDescriptor(
-        name="NASA APOD Viewer",
-        description=_(title_plug),
-        where=PluginDescriptor.WHERE_PLUGINMENU,
-        icon='logo.png',
-        fnc=main
-    )]
+    return [
+        PluginDescriptor(
+            name="NASA APOD Viewer",
+            description=_(title_plug),
+            where=PluginDescriptor.WHERE_PLUGINMENU,
+            icon='logo.png',
+            fnc=main
+        ),
+        PluginDescriptor(
+            where=PluginDescriptor.WHERE_SESSIONSTART,
+            fnc=sessionstart
+        )
+    ]
 
 
 Plugins = plugins
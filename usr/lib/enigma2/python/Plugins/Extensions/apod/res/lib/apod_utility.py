@@ -5,93 +5,272 @@ Created on Mar 24, 2017
 """
 
 from bs4 import BeautifulSoup
+from concurrent.futures import (
+    ProcessPoolExecutor, ThreadPoolExecutor, as_completed)
 import datetime
-import requests
 import logging
 import json
+import os
 import re
-import urllib3
-from lxml import html
+import weakref
+
+from ...apod_http import fetch_text, get_client
+from ...apod_video import LOOKUP_TIMEOUT, get_resolver
+
+try:
+    from lxml import html
+except ImportError:
+    html = None
+
+try:
+    from multiprocessing import get_context
+except ImportError:
+    get_context = None
 
 LOG = logging.getLogger(__name__)
 logging.basicConfig(level=logging.WARN)
 BASE = 'https://apod.nasa.gov/apod/'
-http = urllib3.PoolManager()
+FETCH_WORKERS = 4
+PAGE_TIMEOUT = 30
+PARSE_CHUNK = 10
 
+# compiled once at import: the helpers below run for every page
+LAST_URL = re.compile("(?:.(?!http[s]?://))+$")
+# a 'YYYY Month D' line, e.g. '2024 January 15'
+DATE_LINE = re.compile(
+    r"^[ \t]*(\d{4})[ \t]+([A-Za-z]+)[ \t]+(\d{1,2})[ \t\r]*$", re.M)
 
-# function for getting video thumbnails
-def _get_thumbs(data):
-    global video_thumb
-    if "youtube" in data or "youtu.be" in data:
-        # get ID from YouTube URL
-        youtube_id_regex = re.compile(
-            r"(?:(?<=(v|V)/)|(?<=be/)|(?<=(\?|\&)v=)|(?<=embed/))([\w-]+)")
-        video_id = youtube_id_regex.findall(data)
-        video_id = ''.join(
-            ''.join(elements) for elements in video_id).replace(
-            "?",
-            "").replace(
-            "&",
-            "")
-        # get URL of thumbnail
-        video_thumb = "https://img.youtube.com/vi/" + video_id + "/0.jpg"
-    elif "vimeo" in data:
-        # get ID from Vimeo URL
-        vimeo_id_regex = re.compile(r"(?:/video/)(\d+)")
-        vimeo_id = vimeo_id_regex.findall(data)[0]
-        # make an API call to get thumbnail URL
-        vimeo_request = http.request(
-            "GET",
-            "https://vimeo.com/api/v2/video/" +
-            vimeo_id +
-            ".json")
-        data = json.loads(vimeo_request.data.decode('utf-8'))
-        video_thumb = data[0]['thumbnail_large']
-    else:
-        # the thumbs parameter is True, but the APOD for the date is not a
-        # video, output nothing
-        video_thumb = ""
 
-    return video_thumb
+# function for getting video thumbnails
+def _get_thumbs(data, timeout=LOOKUP_TIMEOUT):
+    """
+    Thumbnail url of the video at `data`, "" when it has none or the
+    lookup fails. Resolved and memoized by apod_video.
+    """
+    try:
+        return get_resolver().resolve(data).result(timeout)
+    except Exception as ex:
+        LOG.warning('No thumbnail for %s: %s', data, ex)
+        return ''
 
 
 # function that returns only last URL if there are multiple URLs stacked
 # together
 def _get_last_url(data):
-    regex = re.compile("(?:.(?!http[s]?://))+$")
-    return regex.findall(data)[0]
+    return LAST_URL.findall(data)[0]
 
 
-def parse_apod_lxml(response_text, dt=None):
-    tree = html.fromstring(response_text)
+MONTHS = ['january', 'february', 'march', 'april',
+          'may', 'june', 'july', 'august',
+          'september', 'october', 'november', 'december']
 
-    # Estrazione dati con XPath
-    props = {
-        'title': tree.xpath('//b[contains(., " Explanation:")]/preceding::b[1]/text()')[0].strip(),
-        'explanation': tree.xpath('//b[contains(., " Explanation:")]/following::text()[1]')[0].strip(),
-        'date': dt.strftime('%Y-%m-%d') if dt else tree.xpath('//center/p[2]/text()')[0].strip(),
-        'url': tree.xpath('//img/@src | //iframe/@src')[0]}
 
-    # Gestione copyright complessa
-    copyright_text = tree.xpath(
-        '//a[contains(text(), "Credit")]/following-sibling::text()')
-    if copyright_text:
-        props['copyright'] = copyright_text[0].strip(' ,')
+def _cp1252(text):
+    """Pages are read as latin1; most of them are really cp1252."""
+    try:
+        return text.encode('latin1').decode('cp1252')
+    except Exception as ex:
+        LOG.debug(str(ex))
+        return text
+
+
+def _media(img_src, hd_href, iframe_src):
+    """(media_type, data, hd_data) from the first img / image link / iframe."""
+    if img_src is not None:
+        # it is an image, so get both the low- and high-resolution data
+        data = BASE + img_src
+        hd_data = BASE + hd_href if hd_href else data
+        return 'image', data, hd_data
+    if iframe_src is not None:
+        # its a video
+        return 'video', iframe_src, None
+    # it is neither image nor video, output empty urls
+    return 'other', '', None
+
 
+def _props(media_type, data, hd_data, title, explanation, copyright_text,
+           date, thumbs):
+    props = {}
+    props['explanation'] = explanation
+    props['title'] = title
+    if copyright_text:
+        props['copyright'] = copyright_text
+    props['media_type'] = media_type
+    if data:
+        props['url'] = _get_last_url(data)
+    props['date'] = date
+    if hd_data:
+        props['hdurl'] = _get_last_url(hd_data)
+    if thumbs and media_type == "video":
+        if thumbs.lower() == "true":
+            props['thumbnail_url'] = _get_thumbs(data)
     return props
 
 
+class _Fields:
+    """Elements the page fields are read from, found in one tree walk."""
+
+    def __init__(self, tree):
+        self.img = self.hd = self.iframe = None
+        self.centers = []
+        self.explanation = None
+        self.credit = None
+        self.marks = []
+        after_mark = False
+        for element in tree.iter():
+            tag = element.tag
+            if tag == 'a':
+                href = element.get('href')
+                if self.hd is None and href and href.startswith('image'):
+                    self.hd = href
+                text = element.text_content()
+                if 'Copyright' in text:
+                    self.marks.append(element)
+                # the credit is the first plain link after the marker
+                if self.credit is None and not len(element):
+                    if after_mark:
+                        self.credit = text.strip()
+                    elif 'Copyright' in text:
+                        after_mark = True
+            elif tag == 'img':
+                if self.img is None:
+                    self.img = element.get('src')
+            elif tag in ('b', 'strong'):
+                text = element.text_content()
+                if tag == 'b' and 'Copyright' in text:
+                    self.marks.append(element)
+                if self.explanation is None and 'Explanation' in text:
+                    self.explanation = element
+            elif tag == 'center':
+                self.centers.append(element)
+            elif tag == 'iframe':
+                if self.iframe is None:
+                    self.iframe = element.get('src')
+
+    def title(self, tree):
+        centers = self.centers
+        try:
+            # later entries: title is the first bold text of the second
+            # center (of the first one on pages with only two)
+            center = centers[0] if len(centers) == 2 else centers[1]
+            bold = next(center.iterdescendants('b'))
+            return bold.text_content().strip()
+        except (IndexError, StopIteration):
+            # early entries: "APOD: 1995 June 16 - Title" in the page title
+            return tree.findtext('.//title').split(' - ')[-1].strip()
+
+    def copyright(self):
+        if self.credit is not None:
+            return self.credit
+        copyright_text = None
+        for element in self.marks:
+            # the credit is whatever follows the marker in the same block
+            parts = [element.tail or '']
+            for sibling in element.itersiblings():
+                parts.append(sibling.text_content())
+                parts.append(sibling.tail or '')
+            stuff = ''.join(parts).strip()
+            if stuff:
+                copyright_text = stuff
+        return copyright_text
+
+    def explanation_text(self):
+        bold = self.explanation
+        if bold is None:
+            raise ValueError('Explanation not found')
+        parts = [bold.tail or '']
+        for sibling in bold.itersiblings():
+            # early pages have no closing paragraph: stop at the next block
+            if sibling.tag in ('p', 'center', 'hr', 'table'):
+                break
+            parts.append(sibling.text_content())
+            parts.append(sibling.tail or '')
+        text = ' '.join(''.join(parts).split())
+        return text.split(' Tomorrow\'s picture')[0].strip()
+
+
+def _text_date(text):
+    """First 'YYYY Month D' line of this or last year in the page text."""
+    _today = datetime.date.today()
+    years = (str(_today.year),
+             str((_today - datetime.timedelta(days=1)).year))
+    for match in DATE_LINE.finditer(text):
+        year, month, day = match.groups()
+        if year not in years:
+            continue
+        try:
+            return datetime.date(
+                year=int(year), month=MONTHS.index(month.lower()) + 1,
+                day=int(day)).strftime('%Y-%m-%d')
+        except ValueError:
+            LOG.debug('unable to retrieve date from line: ' + match.group())
+    raise Exception('Date not found in page.')
+
+
+def parse_apod_lxml(response_text, dt=None, thumbs=False):
+    """
+    Parse an APOD page with lxml. Handles the same layout variants as the
+    BeautifulSoup helpers below; the document is walked once (see _Fields)
+    and each field is then read around the element it was found at.
+    """
+    tree = html.fromstring(_cp1252(response_text))
+    fields = _Fields(tree)
+    media_type, data, hd_data = _media(fields.img, fields.hd, fields.iframe)
+    if dt:
+        date = dt.strftime('%Y-%m-%d')
+    else:
+        date = _text_date(tree.text_content())
+    return _props(
+        media_type, data, hd_data,
+        fields.title(tree),
+        fields.explanation_text(),
+        fields.copyright(),
+        date, thumbs)
+
+
+def parse_apod_soup(response_text, dt=None, thumbs=False):
+    """Parse an APOD page with BeautifulSoup (slower fallback)."""
+    soup = BeautifulSoup(response_text, 'html.parser')
+    LOG.debug('getting the data url')
+    hd_href = None
+    for link in soup.find_all('a', href=True):
+        if link['href'] and link['href'].startswith('image'):
+            hd_href = link['href']
+            break
+    media_type, data, hd_data = _media(
+        soup.img['src'] if soup.img else None,
+        hd_href,
+        soup.iframe['src'] if soup.iframe else None)
+    return _props(
+        media_type, data, hd_data,
+        _title(soup),
+        _explanation(soup),
+        _copyright(soup),
+        dt.strftime('%Y-%m-%d') if dt else _date(soup),
+        thumbs)
+
+
+def parse_apod_page(response_text, dt=None, thumbs=False):
+    """Parse an APOD page with lxml, falling back to BeautifulSoup."""
+    if html is not None:
+        try:
+            return parse_apod_lxml(response_text, dt, thumbs)
+        except Exception as ex:
+            LOG.warning('lxml parser failed (%s), using BeautifulSoup', ex)
+    return parse_apod_soup(response_text, dt, thumbs)
+
+
 def _get_apod_chars(dt, thumbs):
-    media_type = 'image'
     if dt:
         date_str = dt.strftime('%y%m%d')
         apod_url = '%sap%s.html' % (BASE, date_str)
     else:
         apod_url = '%sastropix.html' % BASE
     LOG.debug('OPENING URL:' + apod_url)
-    res = requests.get(apod_url)
+    # conditional GET: an unchanged page is re-read from the local copy
+    status_code, page_text = fetch_text(apod_url)
 
-    if res.status_code == 404:
+    if status_code == 404:
         return None
         # LOG.error(f'No APOD entry for URL: {apod_url}')
         # default_obj_path = 'static/default_apod_object.json'
@@ -103,51 +282,10 @@ def _get_apod_chars(dt, thumbs):
 
         # return default_obj_props
 
-    soup = BeautifulSoup(res.text, 'html.parser')
-    LOG.debug('getting the data url')
-    hd_data = None
-    if soup.img:
-        # it is an image, so get both the low- and high-resolution data
-        data = BASE + soup.img['src']
-        hd_data = data
-
-        LOG.debug('getting the link for hd_data')
-        for link in soup.find_all('a', href=True):
-            if link['href'] and link['href'].startswith('image'):
-                hd_data = BASE + link['href']
-                break
-    elif soup.iframe:
-        # its a video
-        media_type = 'video'
-        data = soup.iframe['src']
-    else:
-        # it is neither image nor video, output empty urls
-        media_type = 'other'
-        data = ''
+    if status_code != 200:
+        raise IOError('HTTP %s for URL: %s' % (status_code, apod_url))
 
-    props = {}
-
-    props['explanation'] = _explanation(soup)
-    props['title'] = _title(soup)
-    copyright_text = _copyright(soup)
-    if copyright_text:
-        props['copyright'] = copyright_text
-    props['media_type'] = media_type
-    if data:
-        props['url'] = _get_last_url(data)
-    if dt:
-        props['date'] = dt.strftime('%Y-%m-%d')
-    else:
-        props['date'] = _date(soup)
-
-    if hd_data:
-        props['hdurl'] = _get_last_url(hd_data)
-
-    if thumbs and media_type == "video":
-        if thumbs.lower() == "true":
-            props['thumbnail_url'] = _get_thumbs(data)
-
-    return props
+    return parse_apod_page(page_text, dt, thumbs)
 
 
 def _title(soup):
@@ -207,7 +345,7 @@ def _copyright(soup):
             # LOG.debug("TEXT: "+element.text)
 
             if use_next:
-                copyright_text = element.text.strip(' ')
+                copyright_text = element.text.strip()
                 break
 
             if 'Copyright' in element.text:
@@ -230,8 +368,8 @@ def _copyright(soup):
                             pass
                         sibling = sibling.next_sibling
 
-                    if stuff:
-                        copyright_text = stuff.strip(' ')
+                    if stuff.strip():
+                        copyright_text = stuff.strip()
         try:
             copyright_text = copyright_text.encode('latin1').decode('cp1252')
         except Exception as ex:
@@ -249,8 +387,24 @@ def _explanation(soup):
     Accepts a BeautifulSoup object for the APOD HTML page and returns the
     APOD image explanation.  Highly idiosyncratic.
     """
-    # Handler for later APOD entries
     LOG.debug('getting the explanation')
+    bold = soup.find(
+        lambda tag: tag.name in ('b', 'strong') and
+        'Explanation' in tag.get_text())
+    if bold is not None:
+        # the text following the marker, as the lxml parser reads it
+        parts = []
+        for sibling in bold.next_siblings:
+            name = getattr(sibling, 'name', None)
+            # early pages have no closing paragraph: stop at the next block
+            if name in ('p', 'center', 'hr', 'table'):
+                break
+            parts.append(sibling.get_text() if name else str(sibling))
+        s = ' '.join(''.join(parts).split())
+        s = s.split(' Tomorrow\'s picture')[0].strip()
+        if s:
+            return _cp1252(s)
+    # Handler for later APOD entries
     s = soup.find_all('p')[2].text
     s = s.replace('\n', ' ')
     s = s.replace('  ', ' ')
@@ -288,29 +442,8 @@ def _date(soup):
     date of the APOD image.
     """
     LOG.debug('getting the date from soup data.')
-    _today = datetime.date.today()
-    for line in soup.text.split('\n'):
-        today_year = str(_today.year)
-        yesterday_year = str((_today - datetime.timedelta(days=1)).year)
-        # Looks for the first line that starts with the current year.
-        # This also checks yesterday's year so it doesn't break on January 1st at 00:00 UTC
-        # before apod.nasa.gov uploads a new image.
-        if line.startswith(today_year) or line.startswith(yesterday_year):
-            LOG.debug('found possible date match: ' + line)
-            # takes apart the date string and turns it into a datetime
-            try:
-                year, month, day = line.split()
-                year = int(year)
-                month = ['january', 'february', 'march', 'april',
-                         'may', 'june', 'july', 'august',
-                         'september', 'october', 'november', 'december'
-                         ].index(month.lower()) + 1
-                day = int(day)
-                return datetime.date(
-                    year=year, month=month, day=day).strftime('%Y-%m-%d')
-            except BaseException:
-                LOG.debug('unable to retrieve date from line: ' + line)
-    raise Exception('Date not found in soup data.')
+    # the first line of this (or, just after new year, last) year
+    return _text_date(soup.text)
 
 
 def parse_apod(dt, use_default_today_date=False, thumbs=False):
@@ -341,6 +474,174 @@ def parse_apod(dt, use_default_today_date=False, thumbs=False):
             raise Exception(ex)
 
 
+def parse_processes(limit=None):
+    """Parser processes for this box: none on a single core."""
+    cores = os.cpu_count() or 1
+    if cores < 2:
+        return 0
+    return min(cores, limit) if limit else cores
+
+
+def _pool_context():
+    """forkserver, else spawn: never fork a multithreaded process."""
+    for method in ('forkserver', 'spawn'):
+        try:
+            return get_context(method)
+        except ValueError:
+            pass
+    return None
+
+
+def parse_pool(processes=None, initializer=None, initargs=()):
+    """
+    Opt-in ProcessPoolExecutor for parse_pages() and parse_apod_batch(),
+    or None when parsing should stay in this process (single core, no
+    multiprocessing). For tools and build hosts only, the plugin parses
+    in process: the workers are started fresh (forkserver or spawn) and
+    must import this module, which enigma2's package cannot do outside
+    enigma2. `initializer(*initargs)` runs first in each worker and can
+    set that package up.
+    """
+    if processes is None:
+        processes = parse_processes()
+    if processes < 1 or get_context is None:
+        return None
+    context = _pool_context()
+    if context is None:
+        return None
+    try:
+        return ProcessPoolExecutor(
+            max_workers=processes, mp_context=context,
+            initializer=initializer, initargs=initargs)
+    except (TypeError, ValueError, OSError) as ex:
+        LOG.warning('No parser processes (%s), parsing in process', ex)
+        return None
+
+
+# pools that failed once: shut down, never used again
+_failed_pools = weakref.WeakSet()
+
+
+def _live_pool(pool):
+    return None if pool is None or pool in _failed_pools else pool
+
+
+def _drop_pool(pool, ex):
+    """Shut down a failed pool (e.g. BrokenProcessPool) for good."""
+    LOG.warning('Parser pool failed (%s), parsing in process', ex)
+    _failed_pools.add(pool)
+    try:
+        pool.shutdown(wait=False)
+    except Exception as ex:
+        LOG.debug(str(ex))
+
+
+def _parse_bytes(data, day):
+    """Pool worker: parse a raw page of `day` ('YYYY-MM-DD')."""
+    dt = datetime.datetime.strptime(day, '%Y-%m-%d') if day else None
+    try:
+        return parse_apod_page(data.decode('latin1', errors='replace'), dt)
+    except Exception as ex:
+        LOG.warning('Unable to parse page of %s: %s', day, ex)
+        return None
+
+
+def _with_thumbs(results, thumbs):
+    """Add the video thumbnails to parsed props, all looked up at once."""
+    # network lookups stay out of the workers
+    if not thumbs or str(thumbs).lower() != 'true':
+        return results
+    videos = [props for props in results
+              if props and props.get('media_type') == 'video']
+    found = get_resolver().resolve_many(
+        props.get('url', '') for props in videos)
+    for props in videos:
+        props['thumbnail_url'] = found[props.get('url', '')]
+    return results
+
+
+def _day(dt):
+    return dt.strftime('%Y-%m-%d') if dt else None
+
+
+def parse_pages(pages, thumbs=False, pool=None):
+    """
+    Parse [(raw page bytes, date or None)] on `pool` (see parse_pool())
+    or in this process. Only the bytes travel to the workers. Returns the
+    props of each page in order, None for the pages that do not parse.
+    A pool that fails is shut down and later calls parse in process.
+    """
+    data = [page for page, _dt in pages]
+    days = [_day(dt) for _page, dt in pages]
+    results = None
+    pool = _live_pool(pool)
+    if pool is not None:
+        try:
+            results = list(pool.map(
+                _parse_bytes, data, days, chunksize=PARSE_CHUNK))
+        except Exception as ex:
+            _drop_pool(pool, ex)
+    if results is None:
+        results = list(map(_parse_bytes, data, days))
+    return _with_thumbs(results, thumbs)
+
+
+def fetch_page(dt, client=None, timeout=PAGE_TIMEOUT):
+    """Raw bytes of the page of `dt`, None when there is no such page."""
+    url = '%sap%s.html' % (BASE, dt.strftime('%y%m%d'))
+    response = (client or get_client()).get(url, timeout=timeout)
+    if response.status_code == 404:
+        return None
+    if response.status_code != 200:
+        raise IOError('HTTP %s for URL: %s' % (response.status_code, url))
+    return response.content
+
+
+def parse_apod_batch(dates, thumbs=False, workers=FETCH_WORKERS, pool=None):
+    """
+    Batch version of parse_apod for many dates: pages are downloaded by
+    `workers` threads and parsed in this process as they arrive or, with
+    a `pool` (see parse_pool()), handed to its processes so fetching and
+    parsing overlap. Returns {date: props}, None for dates without a page
+    or that failed.
+    """
+    pool = _live_pool(pool)
+    results = {}
+    parsing = {}
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as fetcher:
+        fetches = {fetcher.submit(fetch_page, dt): dt for dt in dates}
+        for future in as_completed(fetches):
+            dt = fetches[future]
+            day = _day(dt)
+            try:
+                data = future.result()
+            except Exception as ex:
+                LOG.error('Fetch of %s failed: %s', day, ex)
+                data = None
+            if data is None:
+                results[day] = None
+                continue
+            pool = _live_pool(pool)
+            try:
+                if pool is not None:
+                    future = pool.submit(_parse_bytes, data, day)
+                    parsing[future] = day, data
+                    continue
+            except Exception as ex:
+                _drop_pool(pool, ex)
+            results[day] = _parse_bytes(data, day)
+    for future in as_completed(parsing):
+        day, data = parsing[future]
+        try:
+            results[day] = future.result()
+        except Exception as ex:
+            if _live_pool(pool) is not None:
+                _drop_pool(pool, ex)
+            results[day] = _parse_bytes(data, day)
+    _with_thumbs(list(results.values()), thumbs)
+    return results
+
+
 def get_concepts(request, text, apikey):
     """
     Returns the concepts associated with the text, interleaved with integer